@@ -14,7 +14,16 @@
 
 __all__ = ["babel",
            "blorb",
+           "build",
+           "diff",
+           "gameindex",
            "ifchunks",
+           "ifid",
            "iff",
-           "quetzal"
+           "pack",
+           "patch",
+           "quetzal",
+           "resourcestore",
+           "serve",
+           "sharedblorb"
           ]
@@ -12,10 +12,8 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU General Public License for more details.
 
-from xml.dom.minidom import parseString
-
-
 def getbibliographic(iFiction):
+    from xml.dom.minidom import parseString  # only imported once some metadata is actually wanted
     dom = parseString(iFiction)
     try:
         story = dom.getElementsByTagName('story')[0]  # assumes only one story element
@@ -66,6 +64,7 @@ def getDescription(iFiction):
 
 
 def getZcode(iFiction):
+    from xml.dom.minidom import parseString
     try:
         dom = parseString(iFiction)
         story = dom.getElementsByTagName('story')[0]  # assumes only one story element
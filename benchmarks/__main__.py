@@ -0,0 +1,19 @@
+# Copyright (C) 2001 - 2024 David Fillmore
+#
+# This file is part of ififf.
+#
+# ififf is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# ififf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import sys
+
+from .run import main
+
+sys.exit(main())
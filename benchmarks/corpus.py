@@ -0,0 +1,133 @@
+# Copyright (C) 2001 - 2024 David Fillmore
+#
+# This file is part of ififf.
+#
+# ififf is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# ififf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# synthetic blorbs and Quetzal saves for the benchmarks
+#
+# Everything is made from a seeded random.Random, so the same arguments always give the same bytes, and timings
+# from different runs are of the same files.
+
+from __future__ import annotations
+
+import io
+import random
+
+from .. import build
+from .. import quetzal
+from ..ifchunks import game_identifier_chunk
+
+
+def random_bytes(rng: random.Random, size) -> bytes:
+    return rng.getrandbits(size * 8).to_bytes(size, 'big') if size else b''
+
+
+def png(rng: random.Random, width, height, size) -> bytes:
+    """a PNG signature and IHDR chunk followed by random bytes, which is all blorb.picture_size reads"""
+    ihdr = b'IHDR' + width.to_bytes(4, 'big') + height.to_bytes(4, 'big') + b'\x08\x02\x00\x00\x00'
+    head = b'\x89PNG\r\n\x1a\n' + (13).to_bytes(4, 'big') + ihdr + bytes(4)
+    return head + random_bytes(rng, max(0, size - len(head)))
+
+
+def ogg(rng: random.Random, size) -> bytes:
+    return b'OggS' + random_bytes(rng, max(0, size - 4))
+
+
+def zcode(rng: random.Random, size, release=1, serial=b'240101') -> bytes:
+    header = bytearray(random_bytes(rng, max(64, size)))
+    header[0] = 5
+    header[2:4] = release.to_bytes(2, 'big')
+    header[0x12:0x18] = serial
+    return bytes(header)
+
+
+def ifiction(title='A Synthetic Game', author='The Benchmarks', cover=1, paragraphs=3) -> str:
+    description = '<br/>'.join('Paragraph ' + str(n) + ' of the description, ' + 'with some words ' * 8
+                               for n in range(paragraphs))
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<ifindex version="1.0" xmlns="http://babel.ifarchive.org/protocol/iFiction/">'
+            '<story><identification><ifid>ZCODE-1-240101</ifid><format>zcode</format></identification>'
+            '<bibliographic><title>' + title + '</title><author>' + author + '</author>'
+            '<headline>An interactive benchmark</headline><description>' + description + '</description>'
+            '</bibliographic><zcode><coverpicture>' + str(cover) + '</coverpicture></zcode></story></ifindex>')
+
+
+def make_blorb(pictures=100, sounds=20, picture_size=4096, sound_size=16384, exec_size=65536, descriptions=True,
+               metadata=True, resolution=True, seed=0) -> bytes:
+    """return a blorb file with the given numbers and sizes of resources, and optionally Reso, RDes and IFmd chunks"""
+    rng = random.Random(seed)
+    b = build.blorb_builder()
+    b.add_exec(0, zcode(rng, exec_size))
+    for n in range(1, pictures + 1):
+        b.add_picture(n, png(rng, rng.randrange(16, 1024), rng.randrange(16, 768), picture_size))
+    for n in range(pictures + 1, pictures + sounds + 1):
+        b.add_sound(n, ogg(rng, sound_size))
+    b.set_identifier(1, '240101', 0)
+    b.set_release(1)
+    if pictures:
+        b.set_frontispiece(1)
+    if metadata:
+        b.set_metadata(ifiction())
+    if resolution:
+        b.set_resolution((640, 480, 320, 240, 1920, 1440),
+                         {n: (1, 1, rng.randrange(1, 3), 2, rng.randrange(2, 5), 1) for n in range(1, pictures + 1)})
+    if descriptions:
+        b.set_descriptions({('Pict', n): 'Picture ' + str(n) + ' of the synthetic corpus'
+                            for n in range(1, pictures + 1)})
+    out = io.BytesIO()
+    b.write(out)
+    return out.getvalue()
+
+
+def make_memory(memory_size=65536, change_density=0.05, seed=0) -> tuple[bytes, bytes]:
+    """return (original, current) dynamic memory, with change_density of the current bytes differing"""
+    rng = random.Random(seed)
+    original = random_bytes(rng, memory_size)
+    current = bytearray(original)
+    for p in rng.sample(range(memory_size), int(memory_size * change_density)):
+        current[p] ^= rng.randrange(1, 256)
+    return original, bytes(current)
+
+
+def make_callstack(stack_depth=16, seed=0) -> list[quetzal.frame]:
+    rng = random.Random(seed)
+    return [quetzal.frame(rng.randrange(1 << 24), rng.random() < 0.2, rng.randrange(256), rng.randrange(8),
+                          [rng.randrange(1 << 16) for v in range(rng.randrange(16))],
+                          [rng.randrange(1 << 16) for v in range(rng.randrange(32))])
+            for f in range(stack_depth)]
+
+
+def make_quetzal(memory_size=65536, change_density=0.05, stack_depth=16, seed=0) -> bytes:
+    """return a Quetzal save file with a CMem chunk made from synthetic memory and a Stks chunk of stack_depth frames"""
+    original, current = make_memory(memory_size, change_density, seed)
+    m = quetzal.z_memory(current, original)
+    m.compress()
+    check = quetzal.z_memory(original, original)
+    check.compressed_data = m.compressed_data
+    check.decompress()
+    if check.full_data != current:
+        raise ValueError('CMem data does not decompress to the memory it was made from')
+
+    ifhd = game_identifier_chunk()
+    ifhd.release_number = 1
+    ifhd.serial_number = '240101'
+    ifhd.checksum = 0
+    ifhd.PC = 0x1234
+    cmem = quetzal.cmem_chunk()
+    cmem.dynamic_memory = m.compressed_data
+    stks = quetzal.stks_chunk()
+    stks.callstack = make_callstack(stack_depth, seed)
+
+    q = quetzal.quetzal_chunk()
+    q.sub_chunks = [ifhd, cmem, stks]
+    return q.get_chunk_data()
+
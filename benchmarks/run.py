@@ -0,0 +1,265 @@
+# Copyright (C) 2001 - 2024 David Fillmore
+#
+# This file is part of ififf.
+#
+# ififf is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# ififf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# running the benchmarks: python -m ififf.benchmarks [-o results.json] [-b baseline.json] [name ...]
+#
+# Each benchmark is a function that makes its input and returns what to time, so making the corpus is never
+# timed. Every benchmark is run repeat times, each time for as many loops as timeit.Timer.autorange picks, and
+# the best time per loop is what gets compared against a baseline. Import times are measured in fresh
+# interpreters, since a module is only really imported once per process.
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+
+from .. import babel
+from .. import blorb
+from .. import iff
+from .. import quetzal
+from . import corpus
+
+
+def bench_split_chunks(scale):
+    data = corpus.make_blorb(pictures=100 * scale)
+    body = data[12:]
+    return lambda: iff.split_chunks(body)
+
+
+def bench_form_parse(scale):
+    data = corpus.make_blorb(pictures=100 * scale)
+    return lambda: iff.registry.make(data).sub_chunks
+
+
+def bench_form_serialise(scale):
+    data = corpus.make_blorb(pictures=100 * scale)
+    c = iff.registry.make(data)
+    c.sub_chunks
+    return c.get_chunk_data
+
+
+def bench_blorb_load(scale):
+    data = corpus.make_blorb(pictures=100 * scale)
+    return lambda: blorb.blorb(data)
+
+
+def bench_blorb_load_chunk(scale):
+    data = corpus.make_blorb(pictures=100 * scale)
+    return lambda: blorb.blorb(blorb.blorb_chunk(data))
+
+
+def bench_get_scale(scale):
+    b = blorb.blorb(corpus.make_blorb(pictures=100 * scale))
+    numbers = list(b.images)
+    sizes = [(640 + w, 480 + w) for w in range(32)]  # more sizes than the scale cache holds
+
+    def run():
+        for winx, winy in sizes:
+            for n in numbers:
+                b.getScale(n, winx, winy)
+    return run
+
+
+def bench_memory_compress(scale):
+    original, current = corpus.make_memory(65536 * scale)
+    m = quetzal.z_memory(current, original)
+    return m.compress
+
+
+def bench_memory_decompress(scale):
+    original, current = corpus.make_memory(65536 * scale)
+    m = quetzal.z_memory(current, original)
+    m.compress()
+    return m.decompress
+
+
+def bench_stks_parse(scale):
+    stks = quetzal.stks_chunk()
+    stks.callstack = corpus.make_callstack(64 * scale)
+    data = stks.get_chunk_data()
+    return lambda: quetzal.stks_chunk(data)
+
+
+def bench_stks_serialise(scale):
+    stks = quetzal.stks_chunk()
+    stks.callstack = corpus.make_callstack(64 * scale)
+    return stks.get_chunk_data
+
+
+def bench_quetzal_parse(scale):
+    data = corpus.make_quetzal(memory_size=65536 * scale)
+    return lambda: iff.registry.make(data).sub_chunks
+
+
+def bench_babel(scale):
+    xml = corpus.ifiction(paragraphs=3 * scale)
+
+    def run():
+        babel.getTitle(xml)
+        babel.getAuthor(xml)
+        babel.getHeadline(xml)
+        babel.getDescription(xml)
+        babel.getCoverPicture(xml)
+    return run
+
+
+def bench_image_attributes(scale):
+    images = [blorb.image(n, 'PNG', b'', 0) for n in range(1000 * scale)]
+
+    def run():
+        for i in images:
+            i.standard_numerator, i.minimum_numerator, i.maximum_numerator, i.width
+    return run
+
+
+benchmarks = {'iff.split_chunks': bench_split_chunks,
+              'form_chunk.parse': bench_form_parse,
+              'form_chunk.serialise': bench_form_serialise,
+              'blorb.load': bench_blorb_load,
+              'blorb.load_chunk': bench_blorb_load_chunk,
+              'blorb.getScale': bench_get_scale,
+              'z_memory.compress': bench_memory_compress,
+              'z_memory.decompress': bench_memory_decompress,
+              'stks_chunk.parse': bench_stks_parse,
+              'stks_chunk.serialise': bench_stks_serialise,
+              'quetzal.parse': bench_quetzal_parse,
+              'babel.getters': bench_babel,
+              'image.attributes': bench_image_attributes
+              }
+
+# the modules whose import time is measured, relative to the package
+imports = ('iff', 'blorb', 'quetzal', 'babel', 'build', 'pack')
+
+# how to make one of each record type whose memory is measured
+records = {'resource': lambda n: blorb.resource('Pict', n, n * 8),
+           'image': lambda n: blorb.image(n, 'PNG', b'', n * 8),
+           'sound': lambda n: blorb.sound(n, 'OGGV', b'', n * 8),
+           'frame': lambda n: quetzal.frame(n, False, 0, 0, [], []),
+           'chunk': lambda n: blorb.png_chunk(b'PNG \x00\x00\x00\x00')
+           }
+
+
+def time_benchmark(make, scale=1, repeat=5) -> dict:
+    """return the best and mean seconds per loop, and the loops per repeat, for one benchmark"""
+    timer = timeit.Timer(make(scale))
+    loops, total = timer.autorange()
+    times = [total / loops] + [t / loops for t in timer.repeat(repeat - 1, loops)]
+    return {'best': min(times), 'mean': sum(times) / len(times), 'loops': loops}
+
+
+def import_time(module, repeat=5) -> dict:
+    """return the best and mean seconds to import a module of this package in a new interpreter"""
+    package = __package__.rsplit('.', 1)[0]
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    code = ('import time; start = time.perf_counter(); import ' + package + '.' + module
+            + '; print(time.perf_counter() - start)')
+    times = [float(subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True,
+                                  check=True).stdout)
+             for r in range(repeat)]
+    return {'best': min(times), 'mean': sum(times) / len(times), 'loops': 1}
+
+
+def record_size(make, count=10000) -> float:
+    """return the average bytes allocated for one record, measured over count of them"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = [make(n) for n in range(count)]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del kept
+    return (after - before) / count
+
+
+def run(names=None, scale=1, repeat=5, progress=None) -> dict:
+    """run the named benchmarks (all of them by default), returning results that can be saved as JSON"""
+    results = {}
+    for name, make in benchmarks.items():
+        if names and not any(n in name for n in names):
+            continue
+        results[name] = time_benchmark(make, scale, repeat)
+        if progress:
+            progress(name, results[name])
+    for module in imports:
+        name = 'import ' + module
+        if names and not any(n in name for n in names):
+            continue
+        results[name] = import_time(module, repeat)
+        if progress:
+            progress(name, results[name])
+    return {'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'scale': scale,
+            'results': results,
+            'memory': {name: record_size(make) for name, make in records.items()}
+            }
+
+
+def compare(baseline: dict, results: dict, threshold=0.1) -> list[tuple[str, float]]:
+    """return (name, ratio) for each benchmark more than threshold slower than in the baseline"""
+    slower = []
+    for name, r in results['results'].items():
+        old = baseline.get('results', {}).get(name)
+        if old and old['best'] > 0:
+            ratio = r['best'] / old['best']
+            if ratio > 1 + threshold:
+                slower.append((name, ratio))
+    return slower
+
+
+def show(name, r):
+    print(name.ljust(24) + ('%.3f' % (r['best'] * 1e6)).rjust(14) + ' us' + ('%.3f' % (r['mean'] * 1e6)).rjust(14)
+          + ' us (mean)')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m ififf.benchmarks', description='time ififf on a synthetic corpus')
+    parser.add_argument('names', nargs='*', help='only run benchmarks whose names contain one of these')
+    parser.add_argument('-o', '--output', help='save the results to this JSON file')
+    parser.add_argument('-b', '--baseline', help='compare against results saved by an earlier run')
+    parser.add_argument('-s', '--scale', type=int, default=1, help='multiply the size of the corpus')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('-t', '--threshold', type=float, default=0.1,
+                        help='how much slower than the baseline counts as a regression (0.1 is 10%%)')
+    args = parser.parse_args(argv)
+
+    results = run(args.names, args.scale, args.repeat, show)
+    for name, size in results['memory'].items():
+        print((name + ' record').ljust(24) + ('%.1f' % size).rjust(14) + ' bytes')
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            slower = compare(json.load(f), results, args.threshold)
+        for name, ratio in slower:
+            print('slower: ' + name + ' (' + '%.2f' % ratio + 'x)')
+        if slower:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -13,12 +13,22 @@
 # GNU General Public License for more details.
 from __future__ import annotations
 
+import io
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from types import MappingProxyType
+
 from . import iff
-from . import babel
 from .ifchunks import game_identifier_chunk
 
 
 class resource:
+    __slots__ = ('usage', 'number', 'location')
+
     def __repr__(self):
         return self.usage + ' resource number ' + str(self.number) + ' at ' + str(self.location)
 
@@ -29,64 +39,82 @@ class resource:
 
 
 class game:
-    number = None
-    type = None
-    title = None
-    author = None
-    description = None
-    data = b''
+    __slots__ = ('number', 'type', 'title', 'author', 'description', 'data', 'offset', 'length')
+
+    def __init__(self, number, type, data, offset=0):
+        self.number = number
+        self.type = type
+        self.title = None
+        self.author = None
+        self.description = None
+        self.data = data
+        self.offset = offset
+        self.length = len(data)
 
 
 class image:
-    number = None
-    type = None
-    data = b''
-    standard_numerator = 1
-    standard_denominator = 1
-    minimum_numerator = 0
-    minimum_denominator = 0
-    maximum_numerator = 0
-    maximum_denominator = 0
-
-    def __init__(self, pic_chunk, number):
-        self.type = pic_chunk.ID.strip()
-        self.data = pic_chunk.data
+    __slots__ = ('number', 'type', 'data', 'offset', 'length', 'digest',
+                 'standard_numerator', 'standard_denominator', 'minimum_numerator', 'minimum_denominator',
+                 'maximum_numerator', 'maximum_denominator', 'width', 'height')
+
+    def __init__(self, number, type, data, offset=0):
         self.number = number
+        self.type = type
+        self.data = data
+        self.offset = offset  # where the data starts in the blorb file
+        self.length = len(data)
+        self.digest = None  # set when the data is held by a resource_store
+        self.standard_numerator = 1
+        self.standard_denominator = 1
+        self.minimum_numerator = 0
+        self.minimum_denominator = 0
+        self.maximum_numerator = 0
+        self.maximum_denominator = 0
+        self.width = None  # filled in by blorb.getPictSize
+        self.height = None
 
 
 class sound:
-    number = None
-    type = None
-    data = b''
-    loop = None
-
-    def __init__(self, snd_chunk, number):
-        self.type = snd_chunk.ID.strip()
-        self.data = snd_chunk.data
+    __slots__ = ('number', 'type', 'data', 'offset', 'length', 'digest', 'loop')
+
+    def __init__(self, number, type, data, offset=0):
         self.number = number
+        self.type = type
+        self.data = data
+        self.offset = offset  # where the data starts in the blorb file
+        self.length = len(data)
+        self.digest = None  # set when the data is held by a resource_store
+        self.loop = None
 
 
 class screen:
-    standard_width: int = 1
-    standard_height: int = 1
-    minimum_width: int = 1
-    minimum_height: int = 1
-    maximum_width: int = 1
-    maximum_height: int = 1
+    __slots__ = ('standard_width', 'standard_height', 'minimum_width', 'minimum_height', 'maximum_width',
+                 'maximum_height')
+
+    def __init__(self):
+        self.standard_width = 1
+        self.standard_height = 1
+        self.minimum_width = 1
+        self.minimum_height = 1
+        self.maximum_width = 1
+        self.maximum_height = 1
 
 
 class blorb_chunk(iff.form_chunk):
     subID = 'IFRS'
+    __slots__ = ()
 
 
 class resource_index_chunk(iff.chunk):
     ID = 'RIdx'
-
-    resources = []
+    __slots__ = ('resources',)
 
     def process_data(self):
         self.length = int.from_bytes(self.raw_data[4:8], byteorder='big')
         resource_count = int.from_bytes(self.raw_data[8:12], byteorder='big')
+        if resource_count and (4 + 12 * resource_count > self.length or len(self.raw_data) < 12 + 12 * resource_count):
+            raise iff.InvalidIFFFile(0, self.ID, str(resource_count) + ' resources do not fit in ' + str(self.length)
+                                     + ' bytes')
         self.resources = []
         for r in range(resource_count):
             usage = self.raw_data[12 + r * 12:16 + r * 12].decode('ascii')
@@ -96,21 +124,30 @@ class resource_index_chunk(iff.chunk):
 
 
     def create_data(self):
-        pass
+        data = bytearray(len(self.resources).to_bytes(4, 'big'))
+        for r in self.resources:
+            data.extend(r.usage.encode('ascii'))
+            data.extend(r.number.to_bytes(4, 'big'))
+            data.extend(r.location.to_bytes(4, 'big'))
+        self.length = len(data)
+        self.raw_data = self.ID.encode() + self.length.to_bytes(4, 'big') + bytes(data)
 
 
 # Picture Resource Chunks
 
 class png_chunk(iff.chunk):
     ID = 'PNG '
+    __slots__ = ()
 
 
 class jpeg_chunk(iff.chunk):
     ID = 'JPEG'
+    __slots__ = ()
 
 
 class rect_chunk(iff.chunk):
     ID = 'Rect'
+    __slots__ = ('width', 'height')
 
     def process_data(self):
         self.length = int.from_bytes(self.raw_data[4:8], byteorder='big')
@@ -118,179 +155,242 @@ class rect_chunk(iff.chunk):
         self.height = int.from_bytes(self.raw_data[12:16], byteorder='big')
 
     def create_data(self):
-        self.raw_data = self.ID.encode() + self.length.to_bytes(4, 'big') + self.width.to_bytes(4,
-                                                                                                'big') + self.height.to_bytes(
-            4, 'big')
+        self.length = 8
+        self.raw_data = self.ID.encode() + self.length.to_bytes(4, 'big') + self.width.to_bytes(4, 'big') + \
+                        self.height.to_bytes(4, 'big')
 
 
 # Sound Resource Chunks
 
 class aiff_chunk(iff.form_chunk):
     subID = 'AIFF'
+    __slots__ = ()
 
 
 class oggv_chunk(iff.chunk):
     ID = 'OGGV'
+    __slots__ = ()
 
 
 class mod_chunk(iff.chunk):
     ID = 'MOD '
+    __slots__ = ()
 
 
 class song_chunk(iff.chunk):
     ID = 'SONG'
+    __slots__ = ()
 
 
 # Data Resource Chunks
 
 class text_data_chunk(iff.chunk):
     ID = 'TEXT'
+    __slots__ = ()
 
 
 class binary_data_chunk(iff.chunk):
     ID = 'BINA'
+    __slots__ = ()
 
 
 # Executable Resource Chunks
 
 class zcode_chunk(iff.chunk):
     ID = 'ZCOD'
+    __slots__ = ()
 
 
 class glulx_chunk(iff.chunk):
     ID = 'GLUL'
+    __slots__ = ()
 
 
 class tads2_chunk(iff.chunk):
     ID = 'TAD2'
+    __slots__ = ()
 
 
 class tads3_chunk(iff.chunk):
     ID = 'TAD3'
+    __slots__ = ()
 
 
 class hugo_chunk(iff.chunk):
     ID = 'HUGO'
+    __slots__ = ()
 
 
 class alan_chunk(iff.chunk):
     ID = 'ALAN'
+    __slots__ = ()
 
 
 class adri_chunk(iff.chunk):
     ID = 'ADRI'
+    __slots__ = ()
 
 
 class level9_chunk(iff.chunk):
     ID = 'LEVE'
+    __slots__ = ()
 
 
 class agt_chunk(iff.chunk):
     ID = 'AGT '
+    __slots__ = ()
 
 
 class magnetic_scrolls_chunk(iff.chunk):
     ID = 'MAGS'
+    __slots__ = ()
 
 
 class advsys_chunk(iff.chunk):
     ID = 'ADVS'
+    __slots__ = ()
 
 
 class native_executable_chunk(iff.chunk):
     ID = 'EXEC'
+    __slots__ = ()
 
 
 class color_palette_chunk(iff.chunk):
     ID = 'Plte'
-    palette: None | int | list = None
+    __slots__ = ('palette',)
+    palette: int | bytes  # a colour depth, or packed red, green, blue bytes for each colour
 
     def process_data(self):
         self.length = int.from_bytes(self.raw_data[4:8], byteorder='big')
         if self.length == 1:
-            self.palette = int.from_bytes(self.raw_data[8], byteorder='big')
+            self.palette = self.raw_data[8]
         else:
-            self.palette = []
-            colours = self.length // 3
-            for c in range(colours):
-                colour: dict[str, int] = {'red': int.from_bytes(self.raw_data[8 + c * 3], byteorder='big'),
-                                          'green': int.from_bytes(self.raw_data[9 + c * 3], byteorder='big'),
-                                          'blue': int.from_bytes(self.raw_data[10 + c * 3], byteorder='big')
-                                         }
-                self.palette.append(colour)
+            self.palette = bytes(self.raw_data[8:8 + self.length - self.length % 3])
+
+    def colour(self, n) -> tuple[int, int, int]:
+        return tuple(self.palette[n * 3:n * 3 + 3])
 
     def create_data(self):
-        pass
+        if isinstance(self.palette, int):
+            data = self.palette.to_bytes(1, 'big')
+        else:
+            data = bytes(self.palette or b'')
+        self.length = len(data)
+        self.raw_data = self.ID.encode() + self.length.to_bytes(4, 'big') + data
 
 
 class frontispiece_chunk(iff.chunk):
     ID = 'Fspc'
-    picture_number = None
+    __slots__ = ('picture_number',)
 
     def process_data(self):
         self.length = int.from_bytes(self.raw_data[4:8], byteorder='big')
         self.picture_number = int.from_bytes(self.raw_data[8:12], byteorder='big')
 
     def create_data(self):
-        pass
+        self.length = 4
+        self.raw_data = self.ID.encode() + self.length.to_bytes(4, 'big') + self.picture_number.to_bytes(4, 'big')
 
 
 class resource_description_chunk(iff.chunk):
     ID = 'RDes'
+    __slots__ = ('offsets', 'texts')
+    offsets: dict[tuple[str, int], tuple[int, int]] | None
 
     def process_data(self):
         self.length = int.from_bytes(self.raw_data[4:8], byteorder='big')
+        self.offsets = None  # built the first time a description is asked for
+        self.texts = {}
+
+    def index(self):
+        """build the table of where each (usage, number) description's text is in raw_data"""
+        offsets = {}
         entries_count = int.from_bytes(self.raw_data[8:12], byteorder='big')
-        self.entries = {}
-        p = 0
-        while p < self.length:
-            usage = int.from_bytes(self.raw_data[12 + p:16 + p], byteorder='big')
-            try:
-                self.entries[usage]
-            except:
-                self.entries[usage] = {}
-            number = int.from_bytes(self.raw_data[16 + p:20 + p], byteorder='big')
-            length = int.from_bytes(self.raw_data[20 + p:24 + p], byteorder='big')
-            text = self.raw_data[24 + p:24 + p + length].decode('utf-8')
-            self.entries[usage][number] = text
-            p += 24 + length
+        end = min(len(self.raw_data), 8 + self.length)
+        p = 12
+        for e in range(entries_count):
+            if p + 12 > end:
+                break
+            usage = self.raw_data[p:p + 4].decode('latin-1')  # never fails; check_descriptions rejects non-ASCII
+            number = int.from_bytes(self.raw_data[p + 4:p + 8], byteorder='big')
+            length = int.from_bytes(self.raw_data[p + 8:p + 12], byteorder='big')
+            offsets[(usage, number)] = (p + 12, length)
+            p += 12 + length
+        self.offsets = offsets
+
+    def description(self, usage, number) -> str | None:
+        key = (usage, number)
+        text = self.texts.get(key)
+        if iff.recording is not None:
+            iff.record_cache('descriptions', text is not None)
+        if text is None:
+            if self.offsets is None:
+                self.index()
+            if key not in self.offsets:
+                return None
+            p, length = self.offsets[key]
+            text = self.raw_data[p:p + length].decode('utf-8', errors='replace')
+            self.texts[key] = text
+        return text
 
     def create_data(self):
-        pass
+        if self.offsets is None:
+            self.index()
+        for usage, number in self.offsets:
+            self.description(usage, number)
+        data = bytearray(len(self.texts).to_bytes(4, 'big'))
+        for (usage, number), text in self.texts.items():
+            encoded = text.encode('utf-8')
+            data.extend(usage.encode('latin-1'))
+            data.extend(number.to_bytes(4, 'big'))
+            data.extend(len(encoded).to_bytes(4, 'big'))
+            data.extend(encoded)
+        self.length = len(data)
+        self.raw_data = self.ID.encode() + self.length.to_bytes(4, 'big') + bytes(data)
+        self.offsets = None
 
 
 class metadata_chunk(iff.chunk):
     ID = 'IFmd'
+    __slots__ = ('xml',)
 
     def process_data(self):
         self.length = int.from_bytes(self.raw_data[4:8], byteorder='big')
         self.xml = self.raw_data[8:8 + self.length].decode('utf-8')
 
     def create_data(self):
-        pass
+        data = self.xml.encode('utf-8')
+        self.length = len(data)
+        self.raw_data = self.ID.encode() + self.length.to_bytes(4, 'big') + data
 
 
 # z-machine chunks
 
 class release_number_chunk(iff.chunk):
     ID = 'RelN'
+    __slots__ = ('number',)
 
     def process_data(self):
         self.length = int.from_bytes(self.raw_data[4:8], byteorder='big')
         self.number = int.from_bytes(self.raw_data[8:10], byteorder='big')
 
     def create_data(self):
-        pass
+        self.length = 2
+        self.raw_data = self.ID.encode() + self.length.to_bytes(4, 'big') + self.number.to_bytes(2, 'big')
 
 
 class resolution_chunk(iff.chunk):
     ID = 'Reso'
+    __slots__ = ('screen', 'images')
 
-    screen = {}
-    images: dict[int, dict] = {}
+    screen: dict[str, int]
+    images: dict[int, dict]
 
     def process_data(self):
         self.length = int.from_bytes(self.raw_data[4:8], byteorder='big')
+        self.screen = {}
+        self.images = {}
         self.screen['standard_width'] = int.from_bytes(self.raw_data[8:12], byteorder='big')
         self.screen['standard_height'] = int.from_bytes(self.raw_data[12:16], byteorder='big')
         self.screen['minimum_width'] = int.from_bytes(self.raw_data[16:20], byteorder='big')
@@ -300,88 +400,107 @@ class resolution_chunk(iff.chunk):
 
         resolutions_count = (self.length - 24) // 28
 
-        for r in range(resolutions_count):
-            image_number = int.from_bytes(self.raw_data[32 + r * 28:36 + r * 28], byteorder='big')
-            self.images[image_number] = {}
-            self.images[image_number]['standard_numerator'] = int.from_bytes(self.raw_data[36 + r * 28:40 + r * 28],
-                                                                             byteorder='big')
-            self.images[image_number]['standard_denominator'] = int.from_bytes(self.raw_data[40 + r * 28:44 + r * 28],
-                                                                               byteorder='big')
-            self.images[image_number]['minimum_numerator'] = int.from_bytes(self.raw_data[44 + r * 28:48 + r * 28],
-                                                                            byteorder='big')
-            self.images[image_number]['minimum_denominator'] = int.from_bytes(self.raw_data[52 + r * 28:56 + r * 28],
-                                                                              byteorder='big')
-            self.images[image_number]['maximum_numerator'] = int.from_bytes(self.raw_data[56 + r * 28:60 + r * 28],
-                                                                            byteorder='big')
-            self.images[image_number]['maximum_denominator'] = int.from_bytes(self.raw_data[60 + r * 28:64 + r * 28],
-                                                                              byteorder='big')
+        entries = self.raw_data[32:32 + resolutions_count * 28]
+        for (image_number, standard_numerator, standard_denominator, minimum_numerator, minimum_denominator,
+             maximum_numerator, maximum_denominator) in struct.iter_unpack('>7I', entries):
+            self.images[image_number] = {'standard_numerator': standard_numerator,
+                                         'standard_denominator': standard_denominator,
+                                         'minimum_numerator': minimum_numerator,
+                                         'minimum_denominator': minimum_denominator,
+                                         'maximum_numerator': maximum_numerator,
+                                         'maximum_denominator': maximum_denominator
+                                         }
 
     def create_data(self):
-        pass
+        data = bytearray()
+        for name in ('standard_width', 'standard_height', 'minimum_width', 'minimum_height', 'maximum_width',
+                     'maximum_height'):
+            data.extend(self.screen[name].to_bytes(4, 'big'))
+        for image_number, ratios in self.images.items():
+            data.extend(struct.pack('>7I', image_number,
+                                    ratios['standard_numerator'], ratios['standard_denominator'],
+                                    ratios['minimum_numerator'], ratios['minimum_denominator'],
+                                    ratios['maximum_numerator'], ratios['maximum_denominator']))
+        self.length = len(data)
+        self.raw_data = self.ID.encode() + self.length.to_bytes(4, 'big') + bytes(data)
 
 
 class adaptive_palette_chunk(iff.chunk):
     ID = 'APal'
-    pictures = []
+    __slots__ = ('pictures',)
+    pictures: list[int]
 
     def process_data(self):
         self.length = int.from_bytes(self.raw_data[4:8], byteorder='big')
         palette_count = self.length // 4
+        self.pictures = []
 
         for p in range(palette_count):
             picture_number = int.from_bytes(self.raw_data[8 + p * 4:12 + p * 4], byteorder='big')
             self.pictures.append(picture_number)
 
     def create_data(self):
-        pass
+        data = b''.join(p.to_bytes(4, 'big') for p in self.pictures)
+        self.length = len(data)
+        self.raw_data = self.ID.encode() + self.length.to_bytes(4, 'big') + data
 
 
 class looping_chunk(iff.chunk):
     ID = 'Loop'
-    sound_looping_data = {}
+    __slots__ = ('sound_looping_data',)
+    sound_looping_data: dict[int, int]
 
     def process_data(self):
         self.length = int.from_bytes(self.raw_data[4:8], byteorder='big')
         loop_data_count = self.length // 8
+        self.sound_looping_data = {}
         for a in range(loop_data_count):
             sound_number = int.from_bytes(self.raw_data[8 + a * 8:12 + a * 8], byteorder='big')
-            repeats = int.from_bytes(self.raw_data[8 + a * 8:12 + a * 8], byteorder='big')
+            repeats = int.from_bytes(self.raw_data[12 + a * 8:16 + a * 8], byteorder='big')
             self.sound_looping_data[sound_number] = repeats
 
     def create_data(self):
-        pass
+        data = b''.join(n.to_bytes(4, 'big') + r.to_bytes(4, 'big') for n, r in self.sound_looping_data.items())
+        self.length = len(data)
+        self.raw_data = self.ID.encode() + self.length.to_bytes(4, 'big') + data
 
 
 #
 
 class story_name_chunk(iff.chunk):
     ID = 'SNam'
-    story_name = None
+    __slots__ = ('story_name',)
 
     def process_data(self):
         self.length = int.from_bytes(self.raw_data[4:8], byteorder='big')
-        self.story_name = self.raw_data[8:8 + self.length].decode('utf-16')
+        self.story_name = self.raw_data[8:8 + self.length].decode('utf-16-be')
 
     def create_data(self):
-        self.raw_data = self.ID.encode() + self.length.to_bytes(4, 'big') + self.story_name.encode()
+        data = self.story_name.encode('utf-16-be')
+        self.length = len(data)
+        self.raw_data = self.ID.encode() + self.length.to_bytes(4, 'big') + data
 
 
 # adrift
 
 class gif_chunk(iff.chunk):
     ID = 'GIF '
+    __slots__ = ()
 
 
 class wav_chunk(iff.chunk):
     ID = 'WAV '
+    __slots__ = ()
 
 
 class midi_chunk(iff.chunk):
     ID = 'MIDI'
+    __slots__ = ()
 
 
 class mp3_chunk(iff.chunk):
     ID = 'MP3 '
+    __slots__ = ()
 
 
 ###
@@ -435,8 +554,192 @@ sound_ids = ['FORM', 'OGGV', 'MOD ', 'SONG', 'WAV ', 'MIDI', 'MP3 ']
 
 data_ids = ['TEXT', 'BINA']
 
-iff.chunk_types.update(chunk_types)
-iff.form_types.update(form_types)
+registry = iff.chunk_registry(chunk_types, form_types, iff.registry)
+blorb_chunk.registry = registry
+
+
+def read_index(data) -> list[resource]:
+    """return the resources listed in the RIdx chunk of a blorb held in a bytes-like object (or mmap), reading only chunk headers and the index itself"""
+    if bytes(data[0:4]) != b'FORM' or bytes(data[8:12]) != b'IFRS':
+        raise InvalidBlorbFile('not a blorb file')
+    end = min(len(data), 8 + int.from_bytes(data[4:8], byteorder='big'))
+    for ID, position, length in iff.walk_chunks(data, 12, end):
+        if ID == resource_index_chunk.ID:
+            return resource_index_chunk(bytes(data[position:position + 8 + length])).resources
+    return []
+
+
+def resource_span(data, location) -> tuple[str, int, int]:
+    """return (chunk ID, offset, length) of the resource stored in the chunk at location
+
+    AIFF sounds are stored as a whole FORM chunk, which is itself a complete AIFF file, so their span includes
+    the chunk header; for every other resource it is just the chunk data."""
+    ID = bytes(data[location:location + 4]).decode('ascii')
+    length = int.from_bytes(data[location + 4:location + 8], byteorder='big')
+    if ID == 'FORM':
+        return ID, location, length + 8
+    return ID, location + 8, length
+
+
+resource_chunk_ids = set(game_ids + picture_ids + sound_ids + data_ids)
+
+
+def check_resource(data, res: resource):
+    """raise iff.InvalidIFFFile unless an RIdx entry points at a whole resource chunk inside data"""
+    ID = bytes(data[res.location:res.location + 4])
+    length = int.from_bytes(data[res.location + 4:res.location + 8], byteorder='big')
+    if res.location < 12 or res.location + 8 + length > len(data) or \
+            ID.decode('latin-1') not in resource_chunk_ids and ID != b'FORM':
+        raise iff.InvalidIFFFile(res.location, None, res.usage + ' resource ' + str(res.number)
+                                 + ' does not point at a resource chunk')
+
+
+def check_descriptions(data, position, length):
+    """raise iff.InvalidIFFFile unless every entry of the RDes chunk at position has a printable ASCII usage and fits
+    in the chunk"""
+    end = min(len(data), position + 8 + length)
+    count = int.from_bytes(data[position + 8:position + 12], byteorder='big')
+    p = position + 12
+    for e in range(count):
+        if p + 12 > end:
+            raise iff.InvalidIFFFile(position, resource_description_chunk.ID, 'description ' + str(e)
+                                     + ' runs past the end of the chunk')
+        if not all(0x20 <= b <= 0x7E for b in bytes(data[p:p + 4])):
+            raise iff.InvalidIFFFile(position, resource_description_chunk.ID, 'description ' + str(e)
+                                     + ' has a usage that is not printable ASCII')
+        p += 12 + int.from_bytes(data[p + 8:p + 12], byteorder='big')
+    if p > end:
+        raise iff.InvalidIFFFile(position, resource_description_chunk.ID,
+                                 'the last description runs past the end of the chunk')
+
+
+def read_chunks(data, limits: iff.parse_limits | None = None):
+    """yield the chunks of a blorb held in a bytes-like object (or mmap), except for resource chunks, which are left in place to be read through RIdx
+
+    If limits are given, an RIdx listing more than limits.max_chunks resources is rejected before it is read, and
+    RDes entries are checked."""
+    if bytes(data[0:4]) != b'FORM' or bytes(data[8:12]) != b'IFRS':
+        raise InvalidBlorbFile('not a blorb file')
+    end = min(len(data), 8 + int.from_bytes(data[4:8], byteorder='big'))
+    for ID, position, length in iff.walk_chunks(data, 12, end):
+        if ID not in resource_chunk_ids and ID != '    ':  # '    ' is an IFF filler chunk
+            if limits is not None and ID == resource_index_chunk.ID:
+                count = int.from_bytes(data[position + 8:position + 12], byteorder='big')
+                if count > limits.max_chunks:
+                    raise iff.InvalidIFFFile(position, ID, 'more than ' + str(limits.max_chunks) + ' resources')
+            if limits is not None and ID == resource_description_chunk.ID:
+                check_descriptions(data, position, length)
+            if iff.recording is not None:
+                iff.record_copy(ID, 8 + length)
+            try:
+                yield registry.make(bytes(data[position:position + 8 + length]))
+            except iff.InvalidIFFFile as e:
+                raise iff.InvalidIFFFile(position + e.offset, e.ID, e.reason)
+            except (ValueError, IndexError, struct.error) as e:
+                raise iff.InvalidIFFFile(position, ID, 'unreadable ' + ID + ' chunk: ' + str(e))
+
+
+def load(filename, store=None, limits: iff.parse_limits | None = None) -> blorb:
+    """open a blorb file through a read-only mmap, so that resource data is only paged in from disk when it is used"""
+    with open(filename, 'rb') as f:
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    b = blorb(m, store=store, limits=limits)
+    b.filename = filename
+    return b
+
+
+read_executor = None
+
+
+def get_read_executor():
+    """return the shared, bounded thread pool used by async_blorb when none is given"""
+    global read_executor
+    if read_executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        read_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='blorb-read')
+    return read_executor
+
+
+async def aopen(filename, store=None, executor=None) -> async_blorb:
+    """open a blorb file without blocking the event loop; parsing happens on executor (by default a shared, bounded thread pool)"""
+    import asyncio
+    if executor is None:
+        executor = get_read_executor()
+    b = await asyncio.get_running_loop().run_in_executor(executor, load, filename, store)
+    return async_blorb(b, executor)
+
+
+class async_blorb:
+    """asyncio access to a blorb's resources
+
+    Reads run on the executor, so page faults and disk reads never block the event loop. Concurrent requests for the
+    same resource share one read, and cancelling one request does not cancel the read for the others."""
+
+    def __init__(self, b: blorb, executor=None):
+        self.blorb = b
+        self.executor = executor if executor is not None else get_read_executor()
+        self.pending = {}  # (usage, number) -> future for a read in progress
+
+    async def get_resource(self, usage, number) -> bytes:
+        import asyncio
+        key = (usage, number)
+        future = self.pending.get(key)
+        if future is None:
+            offset, length = self.blorb.getResourceSpan(usage, number)
+            future = asyncio.get_running_loop().run_in_executor(self.executor, self.read, offset, length)
+            self.pending[key] = future
+            future.add_done_callback(lambda f: self.pending.pop(key, None))
+        return await asyncio.shield(future)
+
+    def read(self, offset, length):
+        with memoryview(self.blorb.source) as view:
+            return bytes(view[offset:offset + length])
+
+    async def get_exec(self, execnum):
+        return await self.get_resource('Exec', execnum)
+
+    async def get_pict(self, picnum):
+        return await self.get_resource('Pict', picnum)
+
+    async def get_snd(self, sndnum):
+        return await self.get_resource('Snd ', sndnum)
+
+    def close(self):
+        self.blorb.close()
+
+
+def game_key(game) -> tuple[int, str, int]:
+    """return the (release, serial, checksum) that identifies a z-code story file, read from its header"""
+    release = int.from_bytes(game[2:4], byteorder='big')
+    serial = bytes(game[0x12:0x18]).decode('latin-1')
+    checksum = int.from_bytes(game[0x1C:0x1E], byteorder='big')
+    return release, serial, checksum
+
+
+def read_game_key(data) -> tuple[int | None, tuple[int, str, int] | None]:
+    """return (release, key) for a blorb held in a bytes-like object (or mmap), without reading its resources
+
+    The key comes from the IFhd chunk if there is one, otherwise from the header of a z-code executable.
+    The release comes from RelN, if present, and is otherwise taken from the key."""
+    if bytes(data[0:4]) != b'FORM' or bytes(data[8:12]) != b'IFRS':
+        raise InvalidBlorbFile('not a blorb file')
+    end = min(len(data), 8 + int.from_bytes(data[4:8], byteorder='big'))
+    release = None
+    key = None
+    for ID, position, length in iff.walk_chunks(data, 12, end):
+        if ID == game_identifier_chunk.ID:
+            c = game_identifier_chunk(bytes(data[position:position + 8 + length]))
+            key = (c.release_number, c.serial_number, c.checksum)
+        elif ID == release_number_chunk.ID:
+            release = release_number_chunk(bytes(data[position:position + 8 + length])).number
+    if key is None:
+        for res in read_index(data):
+            if res.usage == 'Exec' and bytes(data[res.location:res.location + 4]) == b'ZCOD':
+                key = game_key(data[res.location + 8:res.location + 8 + 0x1E])
+                break
+    if release is None and key is not None:
+        release = key[0]
+    return release, key
 
 
 class rect:
@@ -472,6 +775,244 @@ class rect:
         return newRect
 
 
+jpeg_sof_markers = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def picture_size(type, data) -> tuple[int, int] | None:
+    """return (width, height) of a picture from its header alone, or None if the header can't be understood, which
+    includes data that doesn't start with the format's signature (a chunk with the wrong ID, say)"""
+    if type == 'PNG':
+        if bytes(data[0:8]) == b'\x89PNG\r\n\x1a\n' and bytes(data[12:16]) == b'IHDR':
+            return int.from_bytes(data[16:20], byteorder='big'), int.from_bytes(data[20:24], byteorder='big')
+    elif type == 'GIF':
+        if bytes(data[0:4]) == b'GIF8':
+            return int.from_bytes(data[6:8], byteorder='little'), int.from_bytes(data[8:10], byteorder='little')
+    elif type == 'Rect':
+        return rect(data).getWidth(), rect(data).getHeight()
+    elif type == 'JPEG':
+        if bytes(data[0:2]) != b'\xff\xd8':  # SOI
+            return None
+        p = 2
+        while p + 4 <= len(data):
+            if data[p] != 0xFF:
+                return None
+            marker = data[p + 1]
+            if marker == 0xFF:  # fill byte
+                p += 1
+                continue
+            if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # markers without a length
+                p += 2
+                continue
+            if marker in jpeg_sof_markers:
+                if p + 9 > len(data):
+                    return None
+                return int.from_bytes(data[p + 7:p + 9], byteorder='big'), int.from_bytes(data[p + 5:p + 7], byteorder='big')
+            p += 2 + int.from_bytes(data[p + 2:p + 4], byteorder='big')
+    return None
+
+
+def touch_pages(source, spans):
+    """read one byte from every page in spans, so they are in memory before they are asked for"""
+    with memoryview(source) as view:
+        for offset, length in spans:
+            for p in range(offset, offset + length, mmap.PAGESIZE):
+                view[p]
+
+
+class access_model:
+    """remembers which resources a game tends to ask for after each other, so that they can be prefetched"""
+
+    def __init__(self):
+        self.following: dict[tuple[str, int], dict[tuple[str, int], int]] = {}
+        self.lock = threading.Lock()
+
+    def record(self, previous, key):
+        if previous is None or previous == key:
+            return
+        with self.lock:
+            counts = self.following.setdefault(previous, {})
+            counts[key] = counts.get(key, 0) + 1
+
+    def predict(self, key, count=2) -> list[tuple[str, int]]:
+        """return up to count resources that have most often been asked for after key"""
+        counts = self.following.get(key)
+        if not counts:
+            return []
+        return sorted(counts, key=counts.get, reverse=True)[:count]
+
+    def save(self, filename):
+        import json
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump([[list(k), [[list(n), c] for n, c in v.items()]] for k, v in self.following.items()], f)
+
+    def load(self, filename):
+        import json
+        with open(filename, 'r', encoding='utf-8') as f:
+            for k, v in json.load(f):
+                self.following[tuple(k)] = {tuple(n): c for n, c in v}
+
+
+numpy = None
+
+
+class scale_table:
+    """the Reso ratios of every picture as flat arrays, so that the scales of all pictures can be worked out at once
+
+    A picture whose Reso entry has a zero denominator is listed in broken and left out of the scales, so that asking
+    for its scale fails instead of loading the blorb."""
+
+    def __init__(self, images: dict[int, image]):
+        self.numbers = tuple(images)
+        self.standard = array('d')
+        self.minimum = array('d')
+        self.maximum = array('d')
+        self.broken = set()
+        for i in images.values():
+            if not i.standard_denominator or i.minimum_numerator and not i.minimum_denominator \
+                    or i.maximum_numerator and not i.maximum_denominator:
+                self.broken.add(i.number)
+                self.standard.append(.0)
+                self.minimum.append(.0)
+                self.maximum.append(.0)
+                continue
+            self.standard.append(i.standard_numerator / i.standard_denominator)
+            self.minimum.append(i.minimum_numerator / i.minimum_denominator if i.minimum_numerator else .0)
+            self.maximum.append(i.maximum_numerator / i.maximum_denominator if i.maximum_numerator else .0)
+
+    def scales(self, ERF) -> dict[int, float]:
+        """return the scale R of every picture for an elastic resize factor of ERF"""
+        global numpy
+        if numpy is None:
+            try:
+                import numpy
+            except ImportError:
+                numpy = False
+        if numpy and len(self.numbers) > 64:
+            std = numpy.frombuffer(self.standard) * ERF
+            low = numpy.frombuffer(self.minimum)
+            high = numpy.frombuffer(self.maximum)
+            R = numpy.where((low != 0) & (std < low), low, numpy.where((high != 0) & (std > high), high, std))
+            result = dict(zip(self.numbers, R.tolist()))
+            for n in self.broken:
+                del result[n]
+            return result
+        result = {}
+        for n, std, low, high in zip(self.numbers, self.standard, self.minimum, self.maximum):
+            if n in self.broken:
+                continue
+            R = ERF * std
+            if low and R < low:
+                R = low
+            elif high and R > high:
+                R = high
+            result[n] = R
+        return result
+
+
+class memory_usage:
+    """bytes held by one or more blorbs, by category
+
+    Owned bytes are only referenced by the blorb: copied resource data, metadata strings and the index tables.
+    Shared bytes are resource data held in a backing buffer (the file's mmap or bytes, or shared memory) or in a
+    resource_store; backing records the size of each of those once, however many resources or blorbs use it."""
+
+    categories = ('executables', 'pictures', 'sounds', 'metadata', 'index')
+
+    def __repr__(self):
+        lines = [c.ljust(12) + str(self.owned[c]).rjust(12) + ' owned' + str(self.shared[c]).rjust(12) + ' shared'
+                 for c in self.categories]
+        lines.append('backing'.ljust(12) + str(self.backing_bytes()).rjust(12) + ' in ' + str(len(self.backing))
+                     + ' buffers and store entries')
+        return '\n'.join(lines)
+
+    def __init__(self):
+        self.owned = dict.fromkeys(self.categories, 0)
+        self.shared = dict.fromkeys(self.categories, 0)
+        self.backing: dict[tuple, int] = {}  # (kind, identity) -> size, for 'mmap', 'buffer' and 'store'
+
+    def add_resource(self, category, r: game | image | sound):
+        if getattr(r, 'digest', None) is not None:
+            self.shared[category] += len(r.data)
+            self.backing[('store', r.digest)] = len(r.data)
+        elif isinstance(r.data, memoryview):
+            self.shared[category] += r.data.nbytes
+        else:
+            self.owned[category] += sys.getsizeof(r.data)
+        self.owned['index'] += sys.getsizeof(r)
+
+    def add_source(self, source):
+        if source is not None:
+            kind = 'mmap' if isinstance(source, mmap.mmap) else 'buffer'
+            self.backing[(kind, id(source))] = len(source)
+
+    def merge(self, other: memory_usage):
+        for c in self.categories:
+            self.owned[c] += other.owned[c]
+            self.shared[c] += other.shared[c]
+        self.backing.update(other.backing)
+
+    def owned_bytes(self) -> int:
+        return sum(self.owned.values())
+
+    def backing_bytes(self, kind=None) -> int:
+        return sum(size for (k, identity), size in self.backing.items() if kind is None or k == kind)
+
+    def as_dict(self) -> dict:
+        return {'owned': dict(self.owned), 'shared': dict(self.shared),
+                'backing': {kind: self.backing_bytes(kind) for kind in ('mmap', 'buffer', 'store')}}
+
+
+def total_memory(blorbs) -> memory_usage:
+    """add up the memory reports of many blorbs, counting each backing buffer and store entry once"""
+    total = memory_usage()
+    for b in blorbs:
+        total.merge(b.memory_report())
+    return total
+
+
+class resource_reader(io.RawIOBase):
+    """a seekable, read-only file object over one resource's span of a blorb's file or mmap"""
+
+    def __init__(self, source, offset, length):
+        self.view = memoryview(source)[offset:offset + length]
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        data = self.view[self.position:self.position + len(b)]
+        n = len(data)
+        memoryview(b).cast('B')[:n] = data
+        self.position += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = len(self.view) + offset
+        else:
+            raise ValueError('invalid whence')
+        if position < 0:
+            raise ValueError('negative seek position')
+        self.position = position
+        return position
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        if not self.closed:
+            self.view.release()
+        super().close()
+
+
 class InvalidBlorbFile(Exception):
     def __init__(self, value):
         self.value = value
@@ -497,40 +1038,73 @@ class NoExecChunk(Exception):
 
 
 class blorb:
-    games = {}
-    images: dict[int, image] = {}
-    sounds = {}
+    games: dict[int, game]
+    images: dict[int, image]
+    sounds: dict[int, sound]
 
-    screen: screen = screen()
+    screen: screen
 
     release = None
     serial = None
     checksum = None
 
     metadata = None
+    descriptions: resource_description_chunk | None = None
+    color_palette = None
+    title_pic = None
+    story_name = None
 
-    currentpalette = [(0, 0, 0), (0, 0, 0), (0, 0, 0), (0, 0, 0), (0, 0, 0), (0, 0, 0), (0, 0, 0), (0, 0, 0),
-                      (0, 0, 0), (0, 0, 0), (0, 0, 0), (0, 0, 0), (0, 0, 0), (0, 0, 0), (0, 0, 0), (0, 0, 0)
-                     ]
-
-    def __init__(self, blorb_chunk):
+    currentpalette: bytearray  # 16 colours as packed red, green, blue bytes
+
+    store = None
+    filename = None
+    access_model = None
+
+    def __init__(self, blorb_chunk, store=None, limits: iff.parse_limits | None = None):
+        """blorb_chunk is either a parsed blorb_chunk, or the whole blorb file as a bytes-like object or mmap
+
+        Resources from a parsed chunk are copied out of it; resources from a bytes-like object are memoryviews
+        into it, so nothing is copied until the data is used.
+        store is an optional resourcestore.resource_store, shared between blorbs so that identical pictures and sounds are only held once
+        limits turns on validation for untrusted files: the structure is checked with iff.validate before anything
+        is parsed, every RIdx entry must point at a whole resource chunk, and any problem raises iff.InvalidIFFFile"""
+        self.store = store
+        self.store_keys = []
+        self.resources: list[resource] = []
+        self.games = {}
+        self.images = {}
+        self.sounds = {}
+        self.screen = screen()
+        self.adaptive_pictures = set()
+        self.currentpalette = bytearray(48)
+        if isinstance(blorb_chunk, iff.chunk):
+            self.source = blorb_chunk.raw_data
+            chunks = blorb_chunk.sub_chunks
+            view = self.source
+        else:
+            self.source = blorb_chunk
+            if limits is not None:
+                iff.validate(blorb_chunk, limits)
+            chunks = read_chunks(blorb_chunk, limits)
+            view = memoryview(blorb_chunk)
         c: iff.chunk
-        for c in blorb_chunk.sub_chunks:
+        for c in chunks:
             if c.ID == resource_index_chunk.ID:
                 c: resource_index_chunk
 
+                self.resources = c.resources
                 res: resource
                 for res in c.resources:
+                    if limits is not None:
+                        check_resource(self.source, res)
+                    ID, offset, length = resource_span(self.source, res.location)
+                    data = view[offset:offset + length]
                     if res.usage == 'Exec':
-                        self.games[res.number] = iff.chunk(iff.get_chunk(blorb_chunk, res.location))
+                        self.games[res.number] = game(res.number, ID.strip(), data, offset)
                     if res.usage == 'Pict':
-                        self.images[res.number] = image(iff.chunk(iff.get_chunk(blorb_chunk, res.location)), res.number)
+                        self.images[res.number] = self._share(image(res.number, ID.strip(), data, offset))
                     if res.usage == 'Snd ':
-                        sound_data = iff.get_chunk(blorb_chunk, res.location)[:]
-                        if sound_data[:4] == b'FORM':
-                            self.sounds[res.number] = sound(iff.chunk(sound_data), res.number)
-                        else:
-                            self.sounds[res.number] = sound(iff.chunk(sound_data[8:]), res.number)
+                        self.sounds[res.number] = self._share(sound(res.number, ID.strip(), data, offset))
             if c.ID == game_identifier_chunk.ID:
                 c: game_identifier_chunk
                 self.release = c.release_number
@@ -544,7 +1118,8 @@ class blorb:
                 c: frontispiece_chunk
                 self.title_pic = c.picture_number
             if c.ID == resource_description_chunk.ID:
-                pass
+                c: resource_description_chunk
+                self.descriptions = c
             if c.ID == metadata_chunk.ID:
                 c: metadata_chunk
                 self.metadata = c.xml[:]
@@ -569,31 +1144,99 @@ class blorb:
                         self.images[image_number].minimum_denominator = c.images[image_number]['minimum_denominator']
                         self.images[image_number].maximum_numerator = c.images[image_number]['maximum_numerator']
                         self.images[image_number].maximum_denominator = c.images[image_number]['maximum_denominator']
-                    except:
+                    except KeyError:  # scaling for a picture that isn't in the index
                         pass
 
             if c.ID == adaptive_palette_chunk.ID:
                 c: adaptive_palette_chunk
-                self.adaptive_pictures = c.pictures
+                self.adaptive_pictures = set(c.pictures)
 
             if c.ID == looping_chunk.ID:
                 c: looping_chunk
                 for a in c.sound_looping_data:
-                    self.sounds[a] = c.sound_looping_data[a]
+                    if a in self.sounds:
+                        self.sounds[a].loop = c.sound_looping_data[a]
             if c.ID == story_name_chunk.ID:
                 c: story_name_chunk
                 self.story_name = c.story_name
 
+        self.scale_table = scale_table(self.images)
+        self.scale_cache = {}
+        self.scale_lock = threading.Lock()
+
+    def _share(self, resource_object):
+        if self.store is not None:
+            resource_object.digest, resource_object.data = self.store.intern(resource_object.data)
+            self.store_keys.append(resource_object.digest)
+        return resource_object
+
+    def close(self):
+        """release this blorb's references to data in its resource store"""
+        if self.store is not None:
+            for key in self.store_keys:
+                self.store.release(key)
+            self.store_keys = []
+
     def checkGame(self, game):
         if not self.release:  # if there's no IFhd chunk, any game will do
             return True
 
-        gameRelease = int.from_bytes(game[2:4], byteorder='big')
-        gameSerial = game[0x12:0x18]
-        gameChecksum = int.from_bytes(game[0x1C:0x1E], byteorder='big')
-        if gameRelease == self.release and gameSerial == self.serial and gameChecksum == self.checksum:
-            return True
-        return False
+        return game_key(game) == (self.release, self.serial, self.checksum)
+
+    def getResourceSpan(self, usage, number) -> tuple[int, int]:
+        """return (offset, length) of a resource's data within the blorb file, for reading or sending it straight from the file"""
+        r = {'Exec': self.games, 'Pict': self.images, 'Snd ': self.sounds}[usage][number]
+        return r.offset, r.length
+
+    def open_resource(self, usage, number) -> resource_reader:
+        """return a seekable file object for a resource, reading from the blorb's file (or mmap) only as it is read"""
+        offset, length = self.getResourceSpan(usage, number)
+        return resource_reader(self.source, offset, length)
+
+    def open_exec(self, execnum):
+        return self.open_resource('Exec', execnum)
+
+    def open_pict(self, picnum):
+        return self.open_resource('Pict', picnum)
+
+    def open_sound(self, sndnum):
+        return self.open_resource('Snd ', sndnum)
+
+    def prefetch(self, resources):
+        """hint that resources, given as (usage, number) pairs such as ('Pict', 3), will be read soon
+
+        For an mmapped blorb this asks the kernel to read the pages ahead; for a file-backed one without madvise
+        the pages are touched from a background thread. Blorbs held in memory have nothing to prefetch."""
+        spans = []
+        for usage, number in resources:
+            try:
+                spans.append(self.getResourceSpan(usage, number))
+            except KeyError:
+                pass
+        if not spans or not isinstance(self.source, mmap.mmap):
+            return
+        if hasattr(self.source, 'madvise') and hasattr(mmap, 'MADV_WILLNEED'):
+            for offset, length in spans:
+                start = offset - offset % mmap.PAGESIZE
+                self.source.madvise(mmap.MADV_WILLNEED, start, offset + length - start)
+        elif self.filename and hasattr(os, 'posix_fadvise'):
+            with open(self.filename, 'rb') as f:
+                for offset, length in spans:
+                    os.posix_fadvise(f.fileno(), offset, length, os.POSIX_FADV_WILLNEED)
+        else:
+            threading.Thread(target=touch_pages, args=(self.source, spans), daemon=True).start()
+
+    def learn_access_order(self, model: access_model | None = None, lookahead=2):
+        """record the order resources are asked for in model, and prefetch the resources that usually come next"""
+        self.access_model = model if model is not None else access_model()
+        self.lookahead = lookahead
+        self.last_access = None
+
+    def record_access(self, usage, number):
+        key = (usage, number)
+        self.access_model.record(self.last_access, key)
+        self.last_access = key
+        self.prefetch(self.access_model.predict(key, self.lookahead))
 
     def getExec(self, execnum):
         return self.games[execnum].data
@@ -602,12 +1245,26 @@ class blorb:
         return self.games[execnum].type
 
     def getPict(self, picnum):
+        if self.access_model is not None:
+            self.record_access('Pict', picnum)
         return self.images[picnum].data
 
     def getPictFormat(self, picnum):
         return self.images[picnum].type
 
+    def getPictSize(self, picnum) -> tuple[int, int] | None:
+        """return (width, height) of a picture, read from its PNG, JPEG or GIF header (or Rect chunk) without decoding it"""
+        i = self.images[picnum]
+        if i.width is None:
+            size = picture_size(i.type, i.data)
+            if size is None:
+                return None
+            i.width, i.height = size
+        return i.width, i.height
+
     def getSnd(self, sndnum):
+        if self.access_model is not None:
+            self.record_access('Snd ', sndnum)
         return self.sounds[sndnum].data
 
     def getSndFormat(self, sndnum):
@@ -629,59 +1286,158 @@ class blorb:
                 self.screen.maximum_width, self.screen.maximum_height
                )
 
-    def getScale(self, picnum, winx, winy):
-
-        px, py, minx, miny, maxx, maxy = self.getWinSizes()
+    def getScales(self, winx, winy) -> MappingProxyType[int, float]:
+        """return the scale R of every picture for a window size, as a read-only mapping; pictures whose Reso ratios
+        have a zero denominator are left out, and getScale raises ZeroDivisionError for them
+
+        Results are remembered for the last few window sizes, so redrawing at the same size costs nothing. The cache
+        is guarded by a lock, so a blorb_view can be shared between threads."""
+        key = (winx, winy)
+        with self.scale_lock:
+            scales = self.scale_cache.get(key)
+        if iff.recording is not None:
+            iff.record_cache('scales', scales is not None)
+        if scales is None:
+            px, py = self.screen.standard_width, self.screen.standard_height
+            if (winx / px) < (winy / py):
+                ERF = winx / px
+            else:
+                ERF = winy / py
+            scales = self.scale_table.scales(ERF)
+            with self.scale_lock:
+                if len(self.scale_cache) >= 16:
+                    self.scale_cache.pop(next(iter(self.scale_cache)), None)
+                self.scale_cache[key] = scales
+        return MappingProxyType(scales)  # the dict itself is shared through the cache
 
-        ratnum = self.images[picnum].standard_numerator
-        ratden = self.images[picnum].standard_denominator
-        minnum = self.images[picnum].minimum_numerator
-        minden = self.images[picnum].minimum_denominator
-        maxnum = self.images[picnum].maximum_numerator
-        maxden = self.images[picnum].maximum_denominator
-
-        stdratio = ratnum / ratden
-        if minnum != 0:
-            minratio = minnum / minden
-        else:
-            minratio = .0
-
-        if maxnum != 0:
-            maxratio = maxnum / maxden
-        else:
-            maxratio = .0
-
-        if (winx / px) < (winy / py):
-            ERF = winx / px
-        else:
-            ERF = winy / py
-        if (ERF * stdratio < minratio) and (minratio != 0):
-            R = minratio
-        elif (ERF * stdratio > maxratio) and (maxratio != 0):
-            R = maxratio
-        else:
-            R = ERF * stdratio
-        return R
+    def getScale(self, picnum, winx, winy):
+        if picnum in self.scale_table.broken:
+            raise ZeroDivisionError('picture ' + str(picnum) + ' has a Reso ratio with a zero denominator')
+        return self.getScales(winx, winy)[picnum]
 
     def adaptPalette(self, picnum, in_palette):
+        """adapt a palette given as a sequence of (red, green, blue) tuples, returning the palette to draw the picture with"""
         in_palette = in_palette[:16]
-        if not in_palette or not self.currentpalette:
+        if not in_palette:
             return in_palette
+        out = self.adaptPaletteTable(picnum, bytes(c for colour in in_palette for c in colour))
+        return [tuple(out[a:a + 3]) for a in range(0, len(out), 3)]
+
+    def adaptPaletteTable(self, picnum, table) -> bytes:
+        """adapt a palette given as packed red, green, blue bytes, returning the packed palette to draw the picture with
 
+        Pictures listed in APal are drawn with the current palette; any other picture's non-black colours from the
+        third onwards become part of the current palette."""
+        table = table[:48]
         if picnum in self.adaptive_pictures:
-            return self.currentpalette
+            return bytes(self.currentpalette)
+        current = self.currentpalette
+        for a in range(6, len(table) - 2, 3):
+            if table[a] or table[a + 1] or table[a + 2]:
+                current[a:a + 3] = table[a:a + 3]
+        return bytes(table)
 
-        for a in range(2, len(in_palette)):
-            if in_palette[a] != (0, 0, 0):
-                self.currentpalette[a] = in_palette[a][:]
-        return in_palette
+    def adaptPalettes(self, pictures) -> list[bytes]:
+        """adapt the packed palettes of a sequence of (picture number, palette) pairs, in drawing order"""
+        return [self.adaptPaletteTable(picnum, table) for picnum, table in pictures]
 
     def getMetaData(self):
         return self.metadata
 
+    def getDescription(self, usage, number) -> str | None:
+        """return the textual description (alt text) of a resource, or None if it has none"""
+        if self.descriptions is None:
+            return None
+        return self.descriptions.description(usage, number)
+
     def getTitlePic(self):
         try:
             return self.images[self.title_pic]
-        except:
+        except KeyError:
             return None
 
+    def memory_report(self) -> memory_usage:
+        """return how many bytes this blorb holds, by category, and whether it owns them or shares them"""
+        m = memory_usage()
+        m.add_source(self.source)
+        for category, table in (('executables', self.games), ('pictures', self.images), ('sounds', self.sounds)):
+            m.owned['index'] += sys.getsizeof(table)
+            for r in table.values():
+                m.add_resource(category, r)
+        m.owned['index'] += sys.getsizeof(self.resources) + sum(sys.getsizeof(r) for r in self.resources)
+        m.owned['index'] += sys.getsizeof(self.adaptive_pictures) + sys.getsizeof(self.scale_cache)
+        m.owned['index'] += sum(sys.getsizeof(scales) for scales in self.scale_cache.values())
+        t = self.scale_table
+        m.owned['index'] += sum(sys.getsizeof(a) for a in (t.numbers, t.standard, t.minimum, t.maximum))
+        for value in (self.metadata, self.story_name, self.color_palette):
+            if value is not None:
+                m.owned['metadata'] += sys.getsizeof(value)
+        if self.descriptions is not None:
+            d = self.descriptions
+            m.owned['metadata'] += sys.getsizeof(d.raw_data) + sys.getsizeof(d.texts)
+            m.owned['metadata'] += sum(sys.getsizeof(text) for text in d.texts.values())
+            if d.offsets is not None:
+                m.owned['metadata'] += sys.getsizeof(d.offsets)
+        return m
+
+    def freeze(self) -> blorb_view:
+        """return a read-only snapshot of this blorb that can be shared between threads without locking"""
+        return blorb_view(self)
+
+
+class blorb_view:
+    """an immutable view of a loaded blorb
+
+    All the tables are copied into read-only mappings when the view is made, so any number of threads can query
+    it at once. Palette adaptation changes state, so each session should keep its own blorb (or palette) for that."""
+
+    __slots__ = ('games', 'images', 'sounds', 'screen', 'resources', 'source', 'filename',
+                 'release', 'serial', 'checksum', 'metadata', 'descriptions', 'color_palette', 'title_pic', 'story_name',
+                 'adaptive_pictures', 'access_model', 'scale_table', 'scale_cache', 'scale_lock')
+
+    def __init__(self, b: blorb):
+        s = screen()
+        for name in screen.__slots__:
+            setattr(s, name, getattr(b.screen, name))
+        values = {'games': MappingProxyType(dict(b.games)),
+                  'images': MappingProxyType(dict(b.images)),
+                  'sounds': MappingProxyType(dict(b.sounds)),
+                  'screen': s,
+                  'resources': tuple(b.resources),
+                  'adaptive_pictures': frozenset(b.adaptive_pictures),
+                  'access_model': None,
+                  'scale_cache': {},
+                  'scale_lock': threading.Lock()
+                  }
+        for name in self.__slots__:
+            object.__setattr__(self, name, values[name] if name in values else getattr(b, name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('blorb_view is read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError('blorb_view is read-only')
+
+    checkGame = blorb.checkGame
+    getResourceSpan = blorb.getResourceSpan
+    open_resource = blorb.open_resource
+    open_exec = blorb.open_exec
+    open_pict = blorb.open_pict
+    open_sound = blorb.open_sound
+    prefetch = blorb.prefetch
+    getExec = blorb.getExec
+    getExecFormat = blorb.getExecFormat
+    getPict = blorb.getPict
+    getPictFormat = blorb.getPictFormat
+    getPictSize = blorb.getPictSize
+    getSnd = blorb.getSnd
+    getSndFormat = blorb.getSndFormat
+    getSndType = blorb.getSndType
+    getWinSizes = blorb.getWinSizes
+    getScales = blorb.getScales
+    getScale = blorb.getScale
+    getMetaData = blorb.getMetaData
+    getDescription = blorb.getDescription
+    getTitlePic = blorb.getTitlePic
+    memory_report = blorb.memory_report
+
@@ -0,0 +1,235 @@
+# Copyright (C) 2001 - 2024 David Fillmore
+#
+# This file is part of ififf.
+#
+# ififf is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# ififf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# writing blorb files
+#
+# Resources are given as file names or bytes-like objects and are only read while they are being written out.
+# Every chunk size, and so every RIdx offset, is worked out beforehand from the sizes of the resources, so the
+# whole file is written front to back in one pass, in constant memory however big the resources are.
+
+from __future__ import annotations
+
+import io
+import os
+
+from . import blorb
+from .ifchunks import game_identifier_chunk
+
+copy_block_size = 1024 * 1024
+
+
+class resource_entry:
+    def __repr__(self):
+        return self.usage + ' ' + str(self.number) + ' (' + self.chunk_id + ', ' + str(self.size) + ' bytes)'
+
+    def __init__(self, usage, number, chunk_id, source):
+        self.usage = usage
+        self.number = number
+        self.chunk_id = chunk_id
+        self.source = source
+        if isinstance(source, (str, os.PathLike)):
+            self.size = os.path.getsize(source)
+        else:
+            self.size = memoryview(source).nbytes
+
+    def chunk_size(self):
+        """the number of bytes this resource takes up in the blorb, including its header and padding"""
+        if self.chunk_id == 'FORM':  # AIFF files are already a complete chunk
+            return self.size + self.size % 2
+        return 8 + self.size + self.size % 2
+
+    def write_data(self, out):
+        """copy the resource's data (without a chunk header or padding) to a binary file object"""
+        if isinstance(self.source, (str, os.PathLike)):
+            with open(self.source, 'rb') as f:
+                copied = copy_file(f, out, self.size)
+        else:
+            copied = out.write(memoryview(self.source).cast('B'))
+        if copied != self.size:
+            raise OSError(str(self.source) + ' changed size while the blorb was being written')
+
+
+class blorb_builder:
+    def __init__(self):
+        self.resources: list[resource_entry] = []
+        self.chunks = []  # chunks other than resources and RIdx, in the order they will be written
+
+    def add_resource(self, usage, number, source, chunk_id):
+        """add a resource from a file name or bytes-like object; chunk_id is the four character chunk ID, such as
+        'PNG ' or 'OGGV', or 'FORM' for an AIFF file, which is stored as it is"""
+        if len(chunk_id) != 4:
+            raise ValueError('chunk IDs are four characters long')
+        if any(r.usage == usage and r.number == number for r in self.resources):
+            raise ValueError(usage + ' resource ' + str(number) + ' has already been added')
+        self.resources.append(resource_entry(usage, number, chunk_id, source))
+
+    def add_exec(self, number, source, chunk_id='ZCOD'):
+        self.add_resource('Exec', number, source, chunk_id)
+
+    def add_picture(self, number, source, chunk_id='PNG '):
+        self.add_resource('Pict', number, source, chunk_id)
+
+    def add_sound(self, number, source, chunk_id='OGGV'):
+        self.add_resource('Snd ', number, source, chunk_id)
+
+    def add_data(self, number, source, chunk_id='BINA'):
+        self.add_resource('Data', number, source, chunk_id)
+
+    def add_chunk(self, c):
+        """add any other chunk object, replacing an earlier chunk with the same ID"""
+        self.chunks = [a for a in self.chunks if a.ID != c.ID]
+        self.chunks.append(c)
+
+    def set_identifier(self, release, serial, checksum):
+        c = game_identifier_chunk()
+        c.release_number = release
+        c.serial_number = serial
+        c.checksum = checksum
+        c.PC = 0
+        self.add_chunk(c)
+
+    def set_release(self, release):
+        c = blorb.release_number_chunk()
+        c.number = release
+        self.add_chunk(c)
+
+    def set_frontispiece(self, picture_number):
+        c = blorb.frontispiece_chunk()
+        c.picture_number = picture_number
+        self.add_chunk(c)
+
+    def set_metadata(self, xml):
+        c = blorb.metadata_chunk()
+        c.xml = xml
+        self.add_chunk(c)
+
+    def set_resolution(self, screen, images=None):
+        """screen is (standard width, standard height, minimum width, minimum height, maximum width, maximum height);
+        images maps picture numbers to (standard numerator, standard denominator, minimum numerator,
+        minimum denominator, maximum numerator, maximum denominator)"""
+        names = ('standard', 'minimum', 'maximum')
+        c = blorb.resolution_chunk()
+        c.screen = {}
+        for a, name in enumerate(names):
+            c.screen[name + '_width'] = screen[a * 2]
+            c.screen[name + '_height'] = screen[a * 2 + 1]
+        c.images = {}
+        for number, ratios in (images or {}).items():
+            c.images[number] = {}
+            for a, name in enumerate(names):
+                c.images[number][name + '_numerator'] = ratios[a * 2]
+                c.images[number][name + '_denominator'] = ratios[a * 2 + 1]
+        self.add_chunk(c)
+
+    def set_loops(self, loops):
+        """loops maps sound numbers to how many times each should repeat"""
+        c = blorb.looping_chunk()
+        c.sound_looping_data = dict(loops)
+        self.add_chunk(c)
+
+    def set_adaptive_palette(self, pictures):
+        c = blorb.adaptive_palette_chunk()
+        c.pictures = list(pictures)
+        self.add_chunk(c)
+
+    def set_descriptions(self, descriptions):
+        """descriptions maps (usage, number) pairs to alt text"""
+        c = blorb.resource_description_chunk()
+        c.offsets = {}
+        c.texts = dict(descriptions)
+        self.add_chunk(c)
+
+    def layout(self) -> tuple[bytes, list[bytes], int]:
+        """return (RIdx chunk, other chunks, total file size), computed from the resource sizes alone"""
+        chunk_data = [c.get_chunk_data() for c in self.chunks]
+        index_size = 8 + 4 + 12 * len(self.resources)
+        position = 12 + index_size + sum(len(c) for c in chunk_data)
+        index = blorb.resource_index_chunk()
+        index.resources = []
+        for r in self.resources:
+            index.resources.append(blorb.resource(r.usage, r.number, position))
+            position += r.chunk_size()
+        return index.get_chunk_data(), chunk_data, position
+
+    def size(self):
+        return self.layout()[2]
+
+    def write(self, out):
+        """write the blorb to a file name or a binary file object, returning the number of bytes written"""
+        if isinstance(out, (str, os.PathLike)):
+            with open(out, 'wb') as f:
+                return self.write(f)
+        index, chunk_data, total = self.layout()
+        out.write(b'FORM' + (total - 8).to_bytes(4, 'big') + b'IFRS')
+        out.write(index)
+        for c in chunk_data:
+            out.write(c)
+        for r in self.resources:
+            if r.chunk_id != 'FORM':
+                out.write(r.chunk_id.encode('ascii') + r.size.to_bytes(4, 'big'))
+            r.write_data(out)
+            if r.size % 2:
+                out.write(b'\x00')
+        return total
+
+
+def copy_file(source, out, size) -> int:
+    """copy size bytes from one binary file object to another, returning how many were copied
+
+    Between two real files the kernel does the copying, with copy_file_range or sendfile, so the data never
+    passes through Python; otherwise, or if either is a pipe, it is copied in blocks."""
+    try:
+        source_fd = source.fileno()
+        out_fd = out.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return copy_blocks(source, out, size)
+    if not source.seekable() or not out.seekable():
+        return copy_blocks(source, out, size)
+    out.flush()
+    source_position = source.tell()
+    out_position = out.tell()
+    copied = 0
+    for method in ('copy_file_range', 'sendfile'):
+        if not hasattr(os, method):
+            continue
+        try:
+            while copied < size:
+                count = min(size - copied, 1 << 30)
+                if method == 'copy_file_range':
+                    n = os.copy_file_range(source_fd, out_fd, count, source_position + copied, out_position + copied)
+                else:
+                    os.lseek(out_fd, out_position + copied, os.SEEK_SET)
+                    n = os.sendfile(out_fd, source_fd, source_position + copied, count)
+                if n == 0:
+                    break
+                copied += n
+        except OSError:
+            if copied:
+                raise
+            continue  # not supported between these two files; try the next way
+        source.seek(source_position + copied)
+        out.seek(out_position + copied)
+        return copied
+    return copy_blocks(source, out, size)
+
+
+def copy_blocks(source, out, size) -> int:
+    copied = 0
+    while copied < size:
+        block = source.read(min(copy_block_size, size - copied))
+        if not block:
+            break
+        out.write(block)
+        copied += len(block)
+    return copied
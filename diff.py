@@ -0,0 +1,286 @@
+# Copyright (C) 2001 - 2024 David Fillmore
+#
+# This file is part of ififf.
+#
+# ififf is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# ififf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# comparing IFF files (blorbs, Quetzal saves) chunk by chunk, and binary deltas between them
+#
+# Files are mmapped and every chunk is streamed through SHA-256, so however big the resources are, only their
+# digests are held. A FORM's digest is taken over its header and its sub-chunks' digests, so nothing is hashed
+# twice. Chunks are named by their path from the top FORM, such as 'FORM IFRS/PNG #2' for the second PNG chunk,
+# except that the chunks a blorb's RIdx points to are named after their resources, such as 'FORM IFRS/Pict 3', so
+# that replacing one resource doesn't renumber the rest. Chunks that only moved are matched by their digests.
+#
+# A delta is 'IFDL', the old file's length and digest and the new file's length, followed by instructions:
+# 'C' with a 4 byte offset and length copies that span of the old file, 'D' with a 4 byte length is followed by
+# that many bytes of new data, and 'E' with the new file's digest ends it. Only the new file's changed top-level
+# chunks go into the delta.
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import mmap
+import os
+
+from . import blorb
+from . import build
+
+hash_block_size = 1024 * 1024
+delta_magic = b'IFDL'
+
+
+class InvalidDelta(Exception):
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
+class chunk_entry:
+    def __repr__(self):
+        return self.path + ' (' + str(self.length) + ' bytes)'
+
+    def __init__(self, path, position, length, digest):
+        self.path = path
+        self.position = position
+        self.length = length
+        self.digest = digest
+
+
+@contextlib.contextmanager
+def open_source(source):
+    """yield a buffer holding a file name's contents through a read-only mmap, or a bytes-like object as it is"""
+    if not isinstance(source, (str, os.PathLike)):
+        yield source
+        return
+    with open(source, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            yield m
+
+
+def chunk_digest(data, position, length) -> bytes:
+    """return the SHA-256 digest of the chunk at position, header included, hashing its data in blocks"""
+    h = hashlib.sha256()
+    with memoryview(data) as view:
+        end = min(len(view), position + 8 + length)
+        for p in range(position, end, hash_block_size):
+            with view[p:min(p + hash_block_size, end)] as block:
+                h.update(block)
+    return h.digest()
+
+
+def chunk_tree(data, start=0, end=None, prefix='') -> list[chunk_entry]:
+    """return an entry for every chunk between start and end, FORM groups and their sub-chunks included, with each
+    group after its sub-chunks"""
+    entries = []
+    seen = {}
+    if end is None:
+        end = len(data)
+    pos = start
+    while pos + 8 <= end:
+        ID = bytes(data[pos:pos + 4]).decode('latin-1')
+        length = int.from_bytes(data[pos + 4:pos + 8], byteorder='big')
+        name = ID
+        if ID == 'FORM' and length >= 4:
+            name = ID + ' ' + bytes(data[pos + 8:pos + 12]).decode('latin-1')
+        seen[name] = seen.get(name, 0) + 1
+        path = prefix + name + (' #' + str(seen[name]) if seen[name] > 1 else '')
+        if name != ID:
+            children = chunk_tree(data, pos + 12, min(end, pos + 8 + length), path + '/')
+            h = hashlib.sha256(bytes(data[pos:pos + 12]))
+            for c in children:
+                if c.path.count('/') == path.count('/') + 1:
+                    h.update(c.digest)
+            entries.extend(children)
+            entries.append(chunk_entry(path, pos, length, h.digest()))
+        else:
+            entries.append(chunk_entry(path, pos, length, chunk_digest(data, pos, length)))
+        pos += 8 + length + (length & 1)
+    return entries
+
+
+def top_level(entries: list[chunk_entry]) -> list[chunk_entry]:
+    """return the entries for the sub-chunks of the outermost FORM, in file order"""
+    return [e for e in entries if e.path.count('/') == 1]
+
+
+def name_resources(data, entries: list[chunk_entry]):
+    """rename the entries for the chunks a blorb's RIdx points to, and their sub-chunks, after their resources"""
+    if bytes(data[0:4]) != b'FORM' or bytes(data[8:12]) != b'IFRS':
+        return
+    names = {}
+    for r in blorb.read_index(data):
+        names.setdefault(r.location, r.usage.strip() + ' ' + str(r.number))
+    renamed = {}
+    for e in top_level(entries):
+        if e.position in names:
+            renamed[e.path] = e.path.split('/')[0] + '/' + names[e.position]
+    for e in entries:
+        top = '/'.join(e.path.split('/')[:2])
+        if top in renamed:
+            e.path = renamed[top] + e.path[len(top):]
+
+
+def resource_digests(data, entries: list[chunk_entry]) -> dict[tuple[str, int], bytes]:
+    """map each (usage, number) in a blorb's RIdx to the digest of the chunk it points to"""
+    if bytes(data[0:4]) != b'FORM' or bytes(data[8:12]) != b'IFRS':
+        return {}
+    by_position = {e.position: e.digest for e in top_level(entries)}
+    return {(r.usage, r.number): by_position.get(r.location) for r in blorb.read_index(data)}
+
+
+class iff_diff:
+    """the chunks and, for blorbs, the RIdx entries that were added, removed or changed between two files"""
+
+    def __repr__(self):
+        lines = []
+        for sign, items in (('+', self.added), ('-', self.removed), ('*', self.changed)):
+            lines.extend(sign + ' ' + p for p in items)
+        for sign, items in (('+', self.resources_added), ('-', self.resources_removed), ('*', self.resources_changed)):
+            lines.extend(sign + ' ' + usage + ' ' + str(number) for usage, number in items)
+        return '\n'.join(lines)
+
+    def __init__(self, old: list[chunk_entry], new: list[chunk_entry], old_resources=None, new_resources=None):
+        # filler chunks ('    ') are dead space, not content
+        old_digests = {e.path: e.digest for e in old if not e.path.rsplit('/', 1)[-1].startswith('    ')}
+        new_digests = {e.path: e.digest for e in new if not e.path.rsplit('/', 1)[-1].startswith('    ')}
+        # chunks are matched by path first, then unmatched ones by digest (they only moved), and whatever is left
+        # at the same path has changed
+        old_left = {p: d for p, d in old_digests.items() if new_digests.get(p) != d}
+        new_left = {p: d for p, d in new_digests.items() if old_digests.get(p) != d}
+        moved = set(old_left.values()) & set(new_left.values())
+        old_left = {p: d for p, d in old_left.items() if d not in moved}
+        new_left = {p: d for p, d in new_left.items() if d not in moved}
+        self.added = [p for p in new_left if p not in old_left]
+        self.removed = [p for p in old_left if p not in new_left]
+        self.changed = [p for p in new_left if p in old_left]
+        old_resources = old_resources or {}
+        new_resources = new_resources or {}
+        self.resources_added = sorted(k for k in new_resources if k not in old_resources)
+        self.resources_removed = sorted(k for k in old_resources if k not in new_resources)
+        self.resources_changed = sorted(k for k in new_resources if k in old_resources
+                                        and old_resources[k] != new_resources[k])
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed
+                    or self.resources_added or self.resources_removed or self.resources_changed)
+
+
+def diff(old, new) -> iff_diff:
+    """compare two IFF files, each given as a file name or a bytes-like object"""
+    with open_source(old) as a, open_source(new) as b:
+        old_entries = chunk_tree(a)
+        new_entries = chunk_tree(b)
+        name_resources(a, old_entries)
+        name_resources(b, new_entries)
+        return iff_diff(old_entries, new_entries, resource_digests(a, old_entries), resource_digests(b, new_entries))
+
+
+def root_digest(entries: list[chunk_entry]) -> bytes:
+    roots = [e for e in entries if '/' not in e.path]
+    if len(roots) != 1 or not roots[0].path.startswith('FORM '):
+        raise ValueError('not an IFF file with a single FORM')
+    return roots[0].digest
+
+
+def make_delta(old, new, out) -> int:
+    """write a delta that turns old into new to a file name or binary file object, returning its size"""
+    if isinstance(out, (str, os.PathLike)):
+        with open(out, 'wb') as f:
+            return make_delta(old, new, f)
+    with open_source(old) as a, open_source(new) as b:
+        old_entries = chunk_tree(a)
+        new_entries = chunk_tree(b)
+        in_old = {}
+        for e in top_level(old_entries):
+            in_old.setdefault(e.digest, e.position)
+
+        instructions = []  # ('C', offset, length) or ('D', offset in new, length), with neighbouring spans merged
+        for kind, offset, length in [('D', 0, 12)] + [
+                ('C', in_old[e.digest], 8 + e.length + (e.length & 1)) if e.digest in in_old
+                else ('D', e.position, min(len(b), e.position + 8 + e.length + (e.length & 1)) - e.position)
+                for e in top_level(new_entries)]:
+            if instructions and instructions[-1][0] == kind and sum(instructions[-1][1:]) == offset:
+                instructions[-1] = (kind, instructions[-1][1], instructions[-1][2] + length)
+            else:
+                instructions.append((kind, offset, length))
+
+        written = out.write(delta_magic + len(a).to_bytes(8, 'big') + root_digest(old_entries)
+                            + len(b).to_bytes(8, 'big'))
+        with memoryview(b) as view:
+            for kind, offset, length in instructions:
+                written += out.write(kind.encode('ascii') + (offset.to_bytes(4, 'big') if kind == 'C' else b'')
+                                     + length.to_bytes(4, 'big'))
+                if kind == 'D':
+                    with view[offset:offset + length] as block:
+                        written += out.write(block)
+        written += out.write(b'E' + root_digest(new_entries))
+    return written
+
+
+def apply_delta(old, delta, output):
+    """rebuild the new file from old (a file name or bytes-like object) and a delta, writing it to output
+
+    old must be the file the delta was made from, and the result is checked before output is replaced."""
+    with open_source(delta) as d, open_source(old) as a:
+        if bytes(d[0:4]) != delta_magic or len(d) < 52:
+            raise InvalidDelta('not a delta')
+        if int.from_bytes(d[4:12], byteorder='big') != len(a) or bytes(d[12:44]) != root_digest(chunk_tree(a)):
+            raise InvalidDelta('the delta was made from a different file')
+        new_length = int.from_bytes(d[44:52], byteorder='big')
+        temp = str(output) + '.tmp'
+        source = open(old, 'rb') if isinstance(old, (str, os.PathLike)) else None
+        try:
+            with open(temp, 'wb') as out, memoryview(d) as view:
+                pos = 52
+                while True:
+                    kind = bytes(d[pos:pos + 1])
+                    if kind == b'E':
+                        expected = bytes(d[pos + 1:pos + 33])
+                        break
+                    if kind == b'C':
+                        offset = int.from_bytes(d[pos + 1:pos + 5], byteorder='big')
+                        length = int.from_bytes(d[pos + 5:pos + 9], byteorder='big')
+                        if offset + length > len(a):
+                            raise InvalidDelta('copy past the end of the old file')
+                        if source is not None:
+                            source.seek(offset)
+                            build.copy_file(source, out, length)
+                        else:
+                            with memoryview(a) as old_view, old_view[offset:offset + length] as block:
+                                out.write(block)
+                        pos += 9
+                    elif kind == b'D':
+                        length = int.from_bytes(d[pos + 1:pos + 5], byteorder='big')
+                        if pos + 5 + length > len(d):
+                            raise InvalidDelta('truncated delta')
+                        with view[pos + 5:pos + 5 + length] as block:
+                            out.write(block)
+                        pos += 5 + length
+                    else:
+                        raise InvalidDelta('bad instruction at ' + str(pos))
+            with open_source(temp) as result:
+                if len(result) != new_length or root_digest(chunk_tree(result)) != expected:
+                    raise InvalidDelta('the rebuilt file does not match')
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+        finally:
+            if source is not None:
+                source.close()
+    os.replace(temp, output)
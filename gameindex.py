@@ -0,0 +1,116 @@
+# Copyright (C) 2001 - 2024 David Fillmore
+#
+# This file is part of ififf.
+#
+# ififf is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# ififf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# a persistent index from story file identity to the blorbs that belong to it, so a story file can be
+# paired with its resources without opening every candidate blorb and calling checkGame on it
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+
+from . import blorb
+
+
+class game_index:
+    version = 1
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.files: dict[str, dict] = {}  # blorb filename -> {'mtime', 'size', 'release', 'key'}
+        self.by_key: dict[tuple[int, str, int], set[str]] = {}
+        self.by_release: dict[int, set[str]] = {}  # blorbs with a RelN chunk but no full key
+        self.wildcards: set[str] = set()  # blorbs with no identifying chunks, which checkGame accepts for any game
+        if filename and os.path.exists(filename):
+            self.load()
+
+    def load(self):
+        with open(self.filename, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved.get('version') != self.version:
+            return
+        for fn, entry in saved['files'].items():
+            if entry['key'] is not None:
+                entry['key'] = tuple(entry['key'])
+            self._insert(fn, entry)
+
+    def save(self, filename=None):
+        if filename:
+            self.filename = filename
+        temp = self.filename + '.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.version, 'files': self.files}, f)
+        os.replace(temp, self.filename)
+
+    def _insert(self, fn, entry):
+        self.files[fn] = entry
+        if entry['key'] is not None:
+            self.by_key.setdefault(entry['key'], set()).add(fn)
+        elif entry['release'] is not None:
+            self.by_release.setdefault(entry['release'], set()).add(fn)
+        else:
+            self.wildcards.add(fn)
+
+    def remove(self, fn):
+        entry = self.files.pop(fn, None)
+        if entry is None:
+            return
+        for table, k in ((self.by_key, entry['key']), (self.by_release, entry['release'])):
+            if k in table:
+                table[k].discard(fn)
+                if not table[k]:
+                    del table[k]
+        self.wildcards.discard(fn)
+
+    def add(self, fn):
+        """index a blorb, returning False if it was already indexed and has not changed since"""
+        st = os.stat(fn)
+        entry = self.files.get(fn)
+        if entry and entry['mtime'] == st.st_mtime_ns and entry['size'] == st.st_size:
+            return False
+        self.remove(fn)
+        with open(fn, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            release, key = blorb.read_game_key(m)
+        self._insert(fn, {'mtime': st.st_mtime_ns, 'size': st.st_size, 'release': release, 'key': key})
+        return True
+
+    def update(self, filenames):
+        """index any new or changed blorbs among filenames and forget indexed blorbs that no longer exist"""
+        for fn in list(self.files):
+            if not os.path.exists(fn):
+                self.remove(fn)
+        for fn in filenames:
+            try:
+                self.add(fn)
+            except (OSError, ValueError, blorb.InvalidBlorbFile):
+                self.remove(fn)
+
+    def find_all(self, game) -> list[str]:
+        """return the indexed blorbs that match a z-code story file, best matches first"""
+        key = blorb.game_key(game)
+        matches = sorted(self.by_key.get(key, ()))
+        matches += sorted(self.by_release.get(key[0], ()))
+        matches += sorted(self.wildcards)
+        return matches
+
+    def find(self, game) -> str | None:
+        """return the indexed blorb that matches a z-code story file, or None"""
+        key = blorb.game_key(game)
+        for table, k in ((self.by_key, key), (self.by_release, key[0])):
+            if table.get(k):
+                return min(table[k])
+        if self.wildcards:
+            return min(self.wildcards)
+        return None
@@ -13,20 +13,61 @@
 # GNU General Public License for more details.
 from __future__ import annotations
 
+import importlib
+import struct
+import time
+
+
+class InvalidIFFFile(ValueError):
+    """a structural problem in an IFF file: offset is where the bad chunk starts, ID its chunk ID if it could be read
+
+    It is a ValueError, as the errors that corrupt files raised before validation was added were, so callers that
+    skip unreadable files by catching ValueError still do."""
+
+    def __init__(self, offset, ID, reason):
+        self.offset = offset
+        self.ID = ID
+        self.reason = reason
+        self.value = (offset, ID, reason)
+
+    def __str__(self):
+        return repr(self.value)
+
+
+class parse_limits:
+    """the most an untrusted IFF file may contain before validate gives up on it"""
+
+    def __init__(self, max_depth=8, max_chunks=65536, max_bytes=1 << 30):
+        self.max_depth = max_depth
+        self.max_chunks = max_chunks
+        self.max_bytes = max_bytes
+
+
+default_limits = parse_limits()
+
 
 class chunk:
-    ID = "    "
-    length = 0
-    data = b''
-    raw_data = b'    \x00\x00\x00\x00'
-    address: int = 0
+    __slots__ = ('raw_data', 'length', 'data', 'address')
 
     def __repr__(self):
         return self.ID + ' chunk'
 
+    @property
+    def ID(self) -> str:
+        """the chunk ID, read from raw_data; the class for each type of chunk replaces this with a constant"""
+        try:
+            return self.raw_data[0:4].decode('ascii')
+        except AttributeError:  # raw_data isn't set yet
+            return '    '
+
     def __init__(self, chunk_data=None):
+        self.length = 0
+        self.data = b''
+        self.address = 0
         if chunk_data:
             self.raw_data = get_chunk(chunk_data)
+        else:
+            self.raw_data = self.ID.encode('ascii') + bytes(4)  # an empty chunk of this type
         self.process_data()
 
     def get_chunk_data(self):
@@ -41,14 +82,13 @@ class chunk:
 
     def process_data(self):
         """updates the various chunk attributes using the raw_data"""
-        self.ID = self.raw_data[0:4].decode('ascii')
         self.length = int.from_bytes(self.raw_data[4:8], byteorder='big')
         self.data = self.raw_data[8:self.length + 8]
 
     def create_data(self):
         """updates the raw_data using the chunk attributes"""
-        length = len(self.data) + 8
-        self.raw_data = self.ID.encode() + length.to_bytes(4, 'big') + self.data
+        self.length = len(self.data)
+        self.raw_data = self.ID.encode() + self.length.to_bytes(4, 'big') + self.data
 
 
 def get_chunk(data: bytes | chunk, position=0):
@@ -58,6 +98,8 @@ def get_chunk(data: bytes | chunk, position=0):
     chunk_length = int.from_bytes(data[position + 4:position + 8], byteorder='big')
     if chunk_length % 2 == 1:
         chunk_length += 1
+    if position == 0 and len(data) == 8 + chunk_length and isinstance(data, bytes):
+        return data  # already exactly one chunk, and bytes can't change, so there's no need to copy it
     c = data[position:position + 8 + chunk_length]
     return c
 
@@ -66,45 +108,207 @@ def split_chunks(data) -> list():
     """find all the top-level chunks in a bytes object, and return a list with each chunk as an item of bytes"""
     pos = 0
     chunks = []
-    while pos < len(data):
+    while pos + 8 <= len(data):  # anything shorter than a chunk header at the end is ignored
         c = get_chunk(data, pos)
         pos += len(c)
         chunks.append(c)
+    if recording is not None and not isinstance(data, memoryview):
+        for c in chunks:
+            record_copy(bytes(c[0:4]).decode('latin-1'), len(c))
     return chunks
 
 
+def walk_chunks(data, start=0, end=None):
+    """yield (ID, position, length) for each chunk header between start and end, without copying any chunk data"""
+    if end is None:
+        end = len(data)
+    pos = start
+    while pos + 8 <= end:
+        try:
+            ID = bytes(data[pos:pos + 4]).decode('ascii')
+        except UnicodeDecodeError:
+            raise InvalidIFFFile(pos, None, 'chunk ID is not ASCII')
+        length = int.from_bytes(data[pos + 4:pos + 8], byteorder='big')
+        yield ID, pos, length
+        pos += 8 + length + (length & 1)
+
+
+def validate(data, limits: parse_limits = default_limits) -> int:
+    """check the structure of an IFF file held in a bytes-like object (or mmap), returning how many chunks it has
+
+    Only chunk headers are read, and every length is checked against its container before it is trusted, so a
+    corrupt or hostile file fails in time proportional to its number of chunks, which the limits also bound.
+    Raises InvalidIFFFile for the first problem found."""
+    if len(data) > limits.max_bytes:
+        raise InvalidIFFFile(0, None, 'file is larger than ' + str(limits.max_bytes) + ' bytes')
+    count = 0
+    stack = [(0, len(data))]  # (position, end) of each group being walked
+    while stack:
+        pos, end = stack.pop()
+        while pos < end:
+            if pos + 8 > end:
+                if pos + 1 == end and len(stack) == 0:
+                    break  # a top-level chunk's final pad byte
+                raise InvalidIFFFile(pos, None, 'truncated chunk header')
+            raw_ID = bytes(data[pos:pos + 4])
+            if not all(0x20 <= b <= 0x7E for b in raw_ID):
+                raise InvalidIFFFile(pos, None, 'chunk ID is not printable ASCII')
+            ID = raw_ID.decode('ascii')
+            length = int.from_bytes(data[pos + 4:pos + 8], byteorder='big')
+            if pos + 8 + length > end:
+                raise InvalidIFFFile(pos, ID, 'declared length ' + str(length) + ' runs past the end of its container')
+            count += 1
+            if count > limits.max_chunks:
+                raise InvalidIFFFile(pos, ID, 'more than ' + str(limits.max_chunks) + ' chunks')
+            next_pos = min(end, pos + 8 + length + (length & 1))
+            if ID in group_types:
+                if length < 4:
+                    raise InvalidIFFFile(pos, ID, 'group chunk has no type')
+                if not all(0x20 <= b <= 0x7E for b in bytes(data[pos + 8:pos + 12])):
+                    raise InvalidIFFFile(pos, ID, 'group type is not printable ASCII')
+                if len(stack) + 1 > limits.max_depth:
+                    raise InvalidIFFFile(pos, ID, 'groups nested more than ' + str(limits.max_depth) + ' deep')
+                stack.append((next_pos, end))
+                stack.append((pos + 12, pos + 8 + length))
+                break
+            pos = next_pos
+    return count
+
+
+def parse(data, limits: parse_limits = default_limits) -> chunk:
+    """validate an untrusted IFF file and then parse it as usual, raising InvalidIFFFile if any chunk is unreadable"""
+    validate(data, limits)
+    if not isinstance(data, bytes):
+        data = bytes(data)  # a memoryview or mmap
+    try:
+        c = registry.make(data)
+        if isinstance(c, form_chunk):
+            c.sub_chunks
+        return c
+    except InvalidIFFFile:
+        raise
+    except (ValueError, IndexError, struct.error) as e:
+        raise InvalidIFFFile(0, data[0:4].decode('latin-1'), 'unreadable chunk: ' + str(e))
+
+
 def identify_chunk(c):
-    if c.ID in chunk_types:
-        c = chunk_types[c.ID](c.raw_data)
-    if c.ID in group_types: # any group chunk should have a 'type' identifier, which we're called a 'subID'
-        if c.subID in group_types[c.ID]:
-            return group_types[c.ID][c.subID](c.raw_data)
-    return c
+    """return a chunk object of the right class for c, found through the default registry"""
+    return registry.identify(c)
+
+
+class chunk_registry:
+    """the chunk classes of one file format by chunk ID, and its FORM classes by group type
+
+    A class can be given as a 'module:name' string, relative to this package, which is only imported the first time
+    a chunk of that type is met. Anything a registry doesn't know is looked up in its parent."""
+
+    def __init__(self, chunks=None, forms=None, parent: chunk_registry | None = None):
+        self.chunks = chunks if chunks is not None else {}
+        self.forms = forms if forms is not None else {}
+        self.parent = parent
+
+    def register(self, ID, handler):
+        self.chunks[ID] = handler
+
+    def register_form(self, subID, handler):
+        self.forms[subID] = handler
+
+    def resolve(self, table, key):
+        handler = table.get(key)
+        if isinstance(handler, str):
+            module, name = handler.split(':')
+            handler = getattr(importlib.import_module(module, __package__), name)
+            table[key] = handler
+        return handler
+
+    def chunk_class(self, ID):
+        r = self
+        while r is not None:
+            handler = r.resolve(r.chunks, ID)
+            if handler is not None:
+                return handler
+            r = r.parent
+        return None
+
+    def form_class(self, subID):
+        r = self
+        while r is not None:
+            handler = r.resolve(r.forms, subID)
+            if handler is not None:
+                return handler
+            r = r.parent
+        return None
+
+    def class_for(self, raw_data):
+        ID = bytes(raw_data[0:4]).decode('ascii')
+        if ID in group_types and len(raw_data) >= 12:  # any group chunk should have a 'type' identifier, which we're calling a 'subID'
+            handler = self.form_class(bytes(raw_data[8:12]).decode('ascii'))
+            if handler is not None:
+                return handler
+        return self.chunk_class(ID)
+
+    def make(self, chunk_data) -> chunk:
+        """parse the chunk at the start of chunk_data straight into an object of the right class"""
+        return (self.class_for(chunk_data) or chunk)(chunk_data)
+
+    def identify(self, c: chunk) -> chunk:
+        handler = self.class_for(c.raw_data)
+        if handler is None or type(c) is handler:
+            return c
+        return handler(c.raw_data)
 
 
 class form_chunk(chunk):
     ID = 'FORM'
-    sub_chunks = []
-    subID = '    '
+    __slots__ = ('parsed_sub_chunks', 'form_data')
+    parsed_sub_chunks: list[chunk] | None
+    registry: chunk_registry | None = None  # the registry for sub-chunks, if not the default one
 
     def __repr__(self):
         return self.ID + ' ' + self.subID + ' chunk'
 
+    @property
+    def subID(self) -> str:
+        """the group type, read from raw_data; the class for each type of FORM replaces this with a constant"""
+        if len(self.raw_data) >= 12:
+            return self.raw_data[8:12].decode('ascii')
+        return '    '
+
     def process_data(self):
-        """updates the various chunk attributes using the raw_data"""
-        self.length = int.from_bytes(self.raw_data[4:8], byteorder='big')
-        subID = self.raw_data[8:12].decode('ascii')
-        self.subID = subID
-        self.data = self.raw_data[12:self.length + 12]
-        sub_chunks_data = split_chunks(self.data)
-        self.sub_chunks: list[chunk] = []
+        """updates the various chunk attributes using the raw_data
 
-        for cd in sub_chunks_data:
-            co = chunk(cd)
-            co = identify_chunk(co)
-            self.sub_chunks.append(co)
+        The sub-chunks aren't split out until sub_chunks is first used, so a FORM that is only wanted as raw bytes
+        (an AIFF sound, say) costs nothing to load."""
+        self.length = int.from_bytes(self.raw_data[4:8], byteorder='big')
+        self.form_data = None
+        self.parsed_sub_chunks = None
+
+    @property
+    def data(self):
+        if self.form_data is None:
+            self.form_data = self.raw_data[12:self.length + 8]
+            if recording is not None and not isinstance(self.form_data, memoryview):
+                record_copy(self.ID, len(self.form_data))
+        return self.form_data
+
+    @data.setter
+    def data(self, value):
+        self.form_data = value
+
+    @property
+    def sub_chunks(self) -> list[chunk]:
+        if self.parsed_sub_chunks is None:
+            r = self.registry or registry
+            self.parsed_sub_chunks = [r.make(cd) for cd in split_chunks(self.data)]
+        return self.parsed_sub_chunks
+
+    @sub_chunks.setter
+    def sub_chunks(self, value):
+        self.parsed_sub_chunks = value
 
     def create_data(self):
+        if self.parsed_sub_chunks is None and self.form_data is None:
+            return  # nothing has been parsed, so nothing can have changed
         temp_data = bytes(self.subID, 'ascii')
 
         for co in self.sub_chunks:
@@ -123,8 +327,8 @@ class form_chunk(chunk):
 
 
 class text_chunk(chunk):  # any chunk where the data is pure text
+    __slots__ = ('text',)
     encoding = 'latin-1'
-    text = ''
 
     def process_data(self):
         """updates the various chunk attributes using the raw_data"""
@@ -133,20 +337,24 @@ class text_chunk(chunk):  # any chunk where the data is pure text
 
     def create_data(self):
         """updates the raw_data using the chunk attributes"""
-        length = len(self.text.encode()) + 8
-        self.raw_data = self.ID.encode() + self.length.to_bytes(length, 'big') + self.text.encode()
+        data = self.text.encode(self.encoding)
+        self.length = len(data)
+        self.raw_data = self.ID.encode() + self.length.to_bytes(4, 'big') + data
 
 
 class auth_chunk(text_chunk):
     ID = 'AUTH'
+    __slots__ = ()
 
 
 class anno_chunk(text_chunk):
     ID = 'ANNO'
+    __slots__ = ()
 
 
 class copy_chunk(text_chunk):
     ID = '(c) '
+    __slots__ = ()
 
 
 chunk_types = {'FORM': form_chunk,
@@ -155,6 +363,157 @@ chunk_types = {'FORM': form_chunk,
                '(c) ': copy_chunk
                }
 
-form_types = {}
+form_types = {'IFRS': '.blorb:blorb_chunk',
+              'AIFF': '.blorb:aiff_chunk',
+              'IFZS': '.quetzal:quetzal_chunk'
+              }
+
+group_types = {'FORM': form_types} # a list of chunk types that are 'groups'. The IFF standard defines three group chunks, which all function as top-level chunks (files). We only care about one type, though.
 
-group_types = {'FORM': form_types} # a list of chunk types that are 'groups'. The IFF standard defines three group chunks, which all function as top-level chunks (files). We only care about one type, though.
\ No newline at end of file
+registry = chunk_registry(chunk_types, form_types)  # the default; each file format has its own, with this as its parent
+
+
+# instrumentation
+#
+# enable_stats swaps chunk.__init__ and chunk.get_chunk_data for versions that time and count every chunk, and
+# disable_stats swaps the plain ones back, so while it is off nothing is measured and nothing costs anything.
+# Code that copies chunk data out of a buffer reports it through record_copy, and caches elsewhere (blorb's scale
+# cache, RDes descriptions, resource stores) report hits and misses through record_cache; both do nothing unless
+# stats are on.
+
+class chunk_stats:
+    __slots__ = ('parsed', 'bytes_parsed', 'bytes_copied', 'parse_time', 'serialised', 'bytes_serialised',
+                 'serialise_time')
+
+    def __init__(self):
+        self.parsed = 0
+        self.bytes_parsed = 0
+        self.bytes_copied = 0  # bytes copied out of the buffer the chunk was parsed from
+        self.parse_time = 0.0  # seconds, including process_data
+        self.serialised = 0
+        self.bytes_serialised = 0
+        self.serialise_time = 0.0  # seconds in create_data; a FORM's time includes its sub-chunks'
+
+    def snapshot(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class recorder:
+    """the counts kept while stats are on, and the observers told about each event"""
+
+    def __init__(self):
+        import threading  # only once stats are turned on, so importing iff stays cheap
+        self.chunks: dict[str, chunk_stats] = {}
+        self.cache_hits: dict[str, int] = {}
+        self.cache_misses: dict[str, int] = {}
+        self.observers = []
+        self.lock = threading.Lock()
+
+    def parsed(self, ID, size, copied, seconds):
+        with self.lock:
+            s = self.chunks.get(ID)
+            if s is None:
+                s = self.chunks[ID] = chunk_stats()
+            s.parsed += 1
+            s.bytes_parsed += size
+            s.bytes_copied += copied
+            s.parse_time += seconds
+        for observer in self.observers:
+            observer('parse', ID, size, seconds)
+
+    def serialised(self, ID, size, seconds):
+        with self.lock:
+            s = self.chunks.get(ID)
+            if s is None:
+                s = self.chunks[ID] = chunk_stats()
+            s.serialised += 1
+            s.bytes_serialised += size
+            s.serialise_time += seconds
+        for observer in self.observers:
+            observer('serialise', ID, size, seconds)
+
+    def copied(self, ID, size):
+        with self.lock:
+            s = self.chunks.get(ID)
+            if s is None:
+                s = self.chunks[ID] = chunk_stats()
+            s.bytes_copied += size
+
+    def cache(self, name, hit):
+        with self.lock:
+            counts = self.cache_hits if hit else self.cache_misses
+            counts[name] = counts.get(name, 0) + 1
+        for observer in self.observers:
+            observer('cache hit' if hit else 'cache miss', name, 0, 0.0)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {'chunks': {ID: s.snapshot() for ID, s in self.chunks.items()},
+                    'cache_hits': dict(self.cache_hits),
+                    'cache_misses': dict(self.cache_misses)}
+
+
+recording: recorder | None = None
+plain_init = chunk.__init__
+plain_get_chunk_data = chunk.get_chunk_data
+
+
+def instrumented_init(self, chunk_data=None):
+    start = time.perf_counter()
+    plain_init(self, chunk_data)
+    seconds = time.perf_counter() - start
+    r = recording
+    if r is not None:
+        raw = self.raw_data
+        copied = 0 if raw is chunk_data or isinstance(raw, memoryview) or not chunk_data else len(raw)
+        r.parsed(self.ID, len(raw), copied, seconds)  # copied counts get_chunk slicing a chunk out of a bigger buffer
+
+
+def instrumented_get_chunk_data(self):
+    start = time.perf_counter()
+    raw = plain_get_chunk_data(self)
+    seconds = time.perf_counter() - start
+    r = recording
+    if r is not None:
+        r.serialised(self.ID, len(raw), seconds)
+    return raw
+
+
+def enable_stats(observer=None) -> recorder:
+    """start counting chunks and cache hits, returning the recorder; observer, if given, is called as
+    observer(event, chunk ID or cache name, bytes, seconds) for each chunk parsed or serialised and each cache lookup"""
+    global recording
+    if recording is None:
+        recording = recorder()
+        chunk.__init__ = instrumented_init
+        chunk.get_chunk_data = instrumented_get_chunk_data
+    if observer is not None:
+        recording.observers.append(observer)
+    return recording
+
+
+def disable_stats():
+    """stop counting and forget the counts"""
+    global recording
+    chunk.__init__ = plain_init
+    chunk.get_chunk_data = plain_get_chunk_data
+    recording = None
+
+
+def stats() -> dict:
+    """return a snapshot of the counts so far, or empty tables if stats are off"""
+    if recording is None:
+        return {'chunks': {}, 'cache_hits': {}, 'cache_misses': {}}
+    return recording.snapshot()
+
+
+def record_copy(ID, size):
+    r = recording
+    if r is not None:
+        r.copied(ID, size)
+
+
+def record_cache(name, hit):
+    r = recording
+    if r is not None:
+        r.cache(name, hit)
@@ -0,0 +1,128 @@
+# Copyright (C) 2001 - 2024 David Fillmore
+#
+# This file is part of ififf.
+#
+# ififf is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# ififf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# Treaty of Babel IFIDs and story file fingerprints, computed in bulk without loading whole files into memory
+
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from . import blorb
+
+block_size = 1024 * 1024  # hashlib releases the GIL for each block, so several files hash in parallel
+
+
+class fingerprint:
+    def __repr__(self):
+        return self.ifid + ' (' + self.format + ') in ' + str(self.filename)
+
+    def __init__(self, filename, number, format, ifid, md5, length):
+        self.filename = filename
+        self.number = number  # the Exec resource number, or None for a bare story file
+        self.format = format
+        self.ifid = ifid
+        self.md5 = md5
+        self.length = length
+
+
+def zcode_ifid(header):
+    """return the legacy IFID built from a z-code header (the same release, serial and checksum fields that blorb.checkGame reads)"""
+    release = int.from_bytes(header[2:4], byteorder='big')
+    serial = ''.join(c if c.isalnum() else '-' for c in bytes(header[0x12:0x18]).decode('latin-1'))
+    checksum = int.from_bytes(header[0x1C:0x1E], byteorder='big')
+    ifid = 'ZCODE-' + str(release) + '-' + serial
+    if serial != '000000' and serial[0].isdigit() and serial[0] != '8':
+        ifid += '-%04X' % checksum
+    return ifid
+
+
+def scan(data, format=None):
+    """stream a story file held in a bytes-like object (or mmap) through MD5, returning (ifid, md5)"""
+    md5 = hashlib.md5()
+    uuid = None
+    tail = b''
+    with memoryview(data) as view:
+        for p in range(0, len(view), block_size):
+            block = view[p:p + block_size]
+            md5.update(block)
+            if uuid is None:
+                # the Treaty lets any format embed its IFID as UUID://...//, so keep enough of the
+                # previous block to catch a marker split across the boundary
+                text = tail + bytes(block)
+                found = text.find(b'UUID://')
+                if found != -1 and text.find(b'//', found + 7) != -1:
+                    uuid = text[found + 7:text.find(b'//', found + 7)].decode('latin-1').upper()
+                tail = text[-48:]
+            block.release()
+    digest = md5.hexdigest().upper()
+    if uuid:
+        return uuid, digest
+    if format == 'ZCOD' and len(data) >= 0x1E:
+        return zcode_ifid(data[:0x1E]), digest
+    return digest, digest
+
+
+def identify_story(data, filename=''):
+    """guess the executable chunk ID of a bare story file from its first few bytes"""
+    if bytes(data[0:4]) == b'Glul':
+        return 'GLUL'
+    if bytes(data[0:4]) == b'TADS':
+        return 'TAD2'
+    if bytes(data[0:8]) == b'T3-image':
+        return 'TAD3'
+    if len(data) >= 0x40 and 1 <= data[0] <= 8 and os.path.splitext(str(filename))[1].lower()[:2] == '.z':
+        return 'ZCOD'
+    return None
+
+
+def fingerprint_file(filename) -> list[fingerprint]:
+    """return a fingerprint for each executable in a blorb, or for a bare story file"""
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            if m[0:4] == b'FORM' and m[8:12] == b'IFRS':
+                results = []
+                for res in blorb.read_index(m):
+                    if res.usage != 'Exec':
+                        continue
+                    format = m[res.location:res.location + 4].decode('ascii')
+                    length = int.from_bytes(m[res.location + 4:res.location + 8], byteorder='big')
+                    with memoryview(m)[res.location + 8:res.location + 8 + length] as data:
+                        ifid, md5 = scan(data, format)
+                    results.append(fingerprint(filename, res.number, format, ifid, md5, length))
+                return results
+            format = identify_story(m, filename)
+            ifid, md5 = scan(m, format)
+            return [fingerprint(filename, None, format, ifid, md5, len(m))]
+
+
+def fingerprint_files(filenames, max_workers=None) -> dict[str, list[fingerprint]]:
+    """fingerprint many blorbs and story files in a thread pool, returning the fingerprints grouped by IFID
+
+    Files that cannot be read or parsed are left out."""
+    catalogue: dict[str, list[fingerprint]] = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(fingerprint_file, fn) for fn in filenames]
+        for future in futures:
+            try:
+                results = future.result()
+            except (OSError, ValueError, blorb.InvalidBlorbFile):
+                continue
+            for fp in results:
+                catalogue.setdefault(fp.ifid, []).append(fp)
+    return catalogue
@@ -0,0 +1,313 @@
+# Copyright (C) 2001 - 2024 David Fillmore
+#
+# This file is part of ififf.
+#
+# ififf is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# ififf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# packing a blorb from a manifest: python -m ififf.pack manifest [-o output]
+#
+# A manifest is a text file with one directive per line; blank lines and lines starting with # are ignored, and
+# file names are relative to the manifest.
+#
+#   output game.zblorb
+#   exec 0 story.z5 [chunk ID]
+#   pict 1 cover.png [chunk ID]
+#   sound 3 boom.aiff [chunk ID]
+#   data 1 extra.bin [chunk ID]
+#   identifier 88 840726 1234   (release, serial, checksum in hex)
+#   release 88
+#   frontispiece 1
+#   metadata story.iFiction
+#   resolution 600 400 300 200 1200 800
+#   scale 1 1 1 1 2 2 1         (picture, then its standard, minimum and maximum ratios)
+#   loop 3 0                    (sound, repeats)
+#   adaptive 1 2 3
+#   description Pict 1 A red door
+#
+# Chunk IDs are worked out from the files' contents when they aren't given. Inputs are checked and hashed in a
+# thread pool, and the hashes are cached next to the output, so when nothing has changed nothing is rewritten.
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from . import blorb
+from . import build
+
+
+class ManifestError(Exception):
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
+usages = {'exec': 'Exec', 'pict': 'Pict', 'sound': 'Snd ', 'data': 'Data'}
+
+allowed_ids = {'Exec': blorb.game_ids, 'Pict': blorb.picture_ids, 'Snd ': blorb.sound_ids, 'Data': blorb.data_ids}
+
+
+def allowed(chunk_id, usage) -> bool:
+    """whether a resource of this usage can be stored in a chunk with this ID; only sounds can be a whole FORM"""
+    if chunk_id == 'FORM':
+        return usage == 'Snd '
+    return chunk_id in allowed_ids[usage]
+
+
+def probe(head, usage) -> str | None:
+    """return the chunk ID for a resource from the first bytes of its file, or None if the format isn't recognised"""
+    if head[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'PNG '
+    if head[:3] == b'\xff\xd8\xff':
+        return 'JPEG'
+    if head[:4] == b'GIF8':
+        return 'GIF '
+    if head[:4] == b'OggS':
+        return 'OGGV'
+    if head[:4] == b'FORM' and head[8:12] in (b'AIFF', b'AIFC'):
+        return 'FORM'
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        return 'WAV '
+    if head[:4] == b'MThd':
+        return 'MIDI'
+    if head[:3] == b'ID3' or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0 and usage == 'Snd '):
+        return 'MP3 '
+    if head[1080:1084] in (b'M.K.', b'M!K!', b'4CHN', b'6CHN', b'8CHN', b'FLT4', b'FLT8'):
+        return 'MOD '
+    if head[:4] == b'Glul':
+        return 'GLUL'
+    if head[:8] == b'T3-image':
+        return 'TAD3'
+    if head[:6] == b'TADS2 ':
+        return 'TAD2'
+    if usage == 'Exec' and len(head) >= 64 and 1 <= head[0] <= 8:
+        return 'ZCOD'
+    if usage == 'Data':
+        try:
+            head.decode('utf-8')
+            return 'TEXT'
+        except UnicodeDecodeError:
+            return 'BINA'
+    return None
+
+
+class input_file:
+    def __repr__(self):
+        return self.usage + ' ' + str(self.number) + ' ' + self.filename
+
+    def __init__(self, usage, number, filename, chunk_id=None):
+        self.usage = usage
+        self.number = number
+        self.filename = filename
+        self.chunk_id = chunk_id
+        self.digest = None
+
+
+class manifest:
+    def __init__(self, filename):
+        self.filename = filename
+        self.directory = os.path.dirname(os.path.abspath(filename))
+        self.output = None
+        self.inputs: list[input_file] = []
+        self.settings = []  # (method name, arguments) to call on the builder
+        self.resolution = None
+        self.scales = {}
+        self.loops = {}
+        self.adaptive = []
+        self.descriptions = {}
+        with open(filename, 'r', encoding='utf-8') as f:
+            self.text = f.read()
+        for line_number, line in enumerate(self.text.splitlines(), 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                self.parse_line(line)
+            except (ValueError, IndexError) as e:
+                raise ManifestError(filename + ':' + str(line_number) + ': ' + str(e) + ': ' + line)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def parse_line(self, line):
+        words = line.split()
+        directive = words[0].lower()
+        if directive in usages:
+            chunk_id = words[3].ljust(4) if len(words) > 3 else None
+            if chunk_id is not None and not allowed(chunk_id, usages[directive]):
+                raise ValueError('not a ' + directive + ' chunk ID')
+            self.inputs.append(input_file(usages[directive], int(words[1]), self.path(words[2]), chunk_id))
+        elif directive == 'output':
+            self.output = self.path(line.split(None, 1)[1])
+        elif directive == 'identifier':
+            self.settings.append(('set_identifier', (int(words[1]), words[2], int(words[3], 16))))
+        elif directive == 'release':
+            self.settings.append(('set_release', (int(words[1]),)))
+        elif directive == 'frontispiece':
+            self.settings.append(('set_frontispiece', (int(words[1]),)))
+        elif directive == 'metadata':
+            with open(self.path(line.split(None, 1)[1]), 'r', encoding='utf-8') as f:
+                self.settings.append(('set_metadata', (f.read(),)))
+        elif directive == 'resolution':
+            self.resolution = tuple(int(w) for w in words[1:7])
+            if len(self.resolution) != 6:
+                raise ValueError('resolution needs six numbers')
+        elif directive == 'scale':
+            ratios = tuple(int(w) for w in words[2:8])
+            if len(ratios) != 6:
+                raise ValueError('scale needs a picture number and six ratios')
+            self.scales[int(words[1])] = ratios
+        elif directive == 'loop':
+            self.loops[int(words[1])] = int(words[2])
+        elif directive == 'adaptive':
+            self.adaptive.extend(int(w) for w in words[1:])
+        elif directive == 'description':
+            usage, number, text = line.split(None, 3)[1:]
+            self.descriptions[(usages.get(usage.lower(), usage.ljust(4)), int(number))] = text
+        else:
+            raise ValueError('unknown directive')
+
+
+def hash_file(filename) -> tuple[str, bytes]:
+    """return (sha256 hex digest, first bytes) of a file, reading it in blocks"""
+    h = hashlib.sha256()
+    head = b''
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(build.copy_block_size)
+            if not block:
+                break
+            if not head:
+                head = block[:2048]
+            h.update(block)
+    return h.hexdigest(), head
+
+
+class hash_cache:
+    """remembers each input's hash and chunk ID by modification time and size, so unchanged inputs aren't re-read"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        self.output = None
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            self.entries = saved['inputs']
+            self.output = saved['output']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def check(self, i: input_file):
+        """fill in the input's digest and chunk ID, from the cache if the file hasn't changed"""
+        st = os.stat(i.filename)
+        entry = self.entries.get(i.filename)
+        if entry and entry['mtime'] == st.st_mtime_ns and entry['size'] == st.st_size:
+            i.digest = entry['digest']
+            head = None
+            chunk_id = entry['chunk_id']
+        else:
+            i.digest, head = hash_file(i.filename)
+            chunk_id = probe(head, i.usage)
+        if i.chunk_id is None:
+            if chunk_id is None:
+                raise ManifestError(i.filename + ': unrecognised ' + i.usage.strip() + ' format')
+            i.chunk_id = chunk_id
+        elif chunk_id is not None and chunk_id != i.chunk_id and i.usage != 'Data':  # TEXT or BINA is only a guess
+            raise ManifestError(i.filename + ': declared as ' + i.chunk_id.strip() + ' but is a ' + chunk_id.strip()
+                                + ' file')
+        if chunk_id is not None and not allowed(chunk_id, i.usage):
+            raise ManifestError(i.filename + ': a ' + chunk_id.strip() + ' file can\'t be used as ' + i.usage.strip())
+        if head is not None and i.chunk_id == 'FORM' and int.from_bytes(head[4:8], 'big') + 8 != st.st_size:
+            raise ManifestError(i.filename + ': AIFF file length does not match its FORM header')
+        self.entries[i.filename] = {'mtime': st.st_mtime_ns, 'size': st.st_size, 'digest': i.digest,
+                                    'chunk_id': chunk_id}
+
+    def save(self, output):
+        self.output = output
+        temp = self.filename + '.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump({'inputs': self.entries, 'output': output}, f)
+        os.replace(temp, self.filename)
+
+
+def pack(manifest_filename, output=None, max_workers=None, force=False) -> bool:
+    """pack the blorb described by a manifest, returning False if it was already up to date"""
+    m = manifest(manifest_filename)
+    output = output or m.output
+    if output is None:
+        raise ManifestError(manifest_filename + ': no output file given')
+    cache = hash_cache(output + '.cache')
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        list(pool.map(cache.check, m.inputs))
+
+    # everything that decides the output: the manifest itself, each input's contents, and the settings, which
+    # include the contents of the metadata file
+    fingerprint = hashlib.sha256(m.text.encode('utf-8'))
+    for i in m.inputs:
+        fingerprint.update((i.usage + str(i.number) + i.chunk_id + i.digest).encode('ascii'))
+    for method, arguments in m.settings:
+        fingerprint.update(repr((method, arguments)).encode('utf-8'))
+    fingerprint = fingerprint.hexdigest()
+    if not force and cache.output and cache.output.get('fingerprint') == fingerprint and os.path.exists(output) \
+            and os.path.getsize(output) == cache.output.get('size'):
+        cache.save(cache.output)
+        return False
+
+    builder = build.blorb_builder()
+    for i in m.inputs:
+        builder.add_resource(i.usage, i.number, i.filename, i.chunk_id)
+    for method, arguments in m.settings:
+        getattr(builder, method)(*arguments)
+    if m.resolution is not None:
+        builder.set_resolution(m.resolution, m.scales)
+    elif m.scales:
+        raise ManifestError(manifest_filename + ': scale lines need a resolution line')
+    if m.loops:
+        builder.set_loops(m.loops)
+    if m.adaptive:
+        builder.set_adaptive_palette(m.adaptive)
+    if m.descriptions:
+        builder.set_descriptions(m.descriptions)
+
+    temp = output + '.tmp'
+    size = builder.write(temp)
+    os.replace(temp, output)
+    cache.save({'fingerprint': fingerprint, 'size': size})
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m ififf.pack', description='pack a blorb file from a manifest')
+    parser.add_argument('manifest')
+    parser.add_argument('-o', '--output', help='the blorb file to write (overrides the manifest\'s output line)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='how many files to hash at once')
+    parser.add_argument('-f', '--force', action='store_true', help='write the blorb even if nothing has changed')
+    args = parser.parse_args(argv)
+    try:
+        written = pack(args.manifest, args.output, args.jobs, args.force)
+    except (ManifestError, OSError) as e:
+        print(str(e).strip("'"), file=sys.stderr)
+        return 1
+    if not written:
+        print('up to date')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
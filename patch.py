@@ -0,0 +1,208 @@
+# Copyright (C) 2001 - 2024 David Fillmore
+#
+# This file is part of ififf.
+#
+# ififf is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# ififf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# changing blorb files in place
+#
+# replace_resource appends the new resource to the end of the FORM and then rewrites only its RIdx entry and the
+# FORM length, so the cost doesn't depend on the size of the blorb. The old chunk is turned into an IFF filler
+# chunk (ID '    '), which every reader skips; compact rewrites the file without them, and repack also puts
+# the resources a game needs first at the front and can page-align the rest.
+
+from __future__ import annotations
+
+import mmap
+import os
+
+from . import blorb
+from . import build
+from . import iff
+
+filler_id = '    '
+
+
+def read_layout(data):
+    """return (FORM length, RIdx position, resources) for a blorb held in a bytes-like object or mmap"""
+    if bytes(data[0:4]) != b'FORM' or bytes(data[8:12]) != b'IFRS':
+        raise blorb.InvalidBlorbFile('not a blorb file')
+    form_length = int.from_bytes(data[4:8], byteorder='big')
+    for ID, position, length in iff.walk_chunks(data, 12, min(len(data), 8 + form_length)):
+        if ID == blorb.resource_index_chunk.ID:
+            return form_length, position, blorb.read_index(data)
+    raise blorb.InvalidBlorbFile('no resource index')
+
+
+def replace_resource(filename, usage, number, source, chunk_id=None) -> int:
+    """replace a resource with a file name or bytes-like object, returning the new chunk's position
+
+    chunk_id is worked out from the new data if it isn't given. The resource must already be in the index."""
+    with open(filename, 'r+b') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            form_length, index_position, resources = read_layout(m)
+            entry = next((n for n, r in enumerate(resources) if r.usage == usage and r.number == number), None)
+            if entry is None:
+                raise KeyError(usage + ' resource ' + str(number) + ' is not in the index')
+            old_location = resources[entry].location
+            shared = any(r.location == old_location for n, r in enumerate(resources) if n != entry)
+            if chunk_id is None:
+                from .pack import probe
+                if isinstance(source, (str, os.PathLike)):
+                    with open(source, 'rb') as s:
+                        head = s.read(2048)
+                else:
+                    head = bytes(memoryview(source)[:2048])
+                chunk_id = probe(head, usage)
+                if chunk_id is None:
+                    raise ValueError('unrecognised ' + usage.strip() + ' format')
+
+        r = build.resource_entry(usage, number, chunk_id, source)
+        location = 8 + form_length + form_length % 2
+        f.seek(location)
+        if chunk_id != 'FORM':
+            f.write(chunk_id.encode('ascii') + r.size.to_bytes(4, 'big'))
+        r.write_data(f)
+        if r.size % 2:
+            f.write(b'\x00')
+        new_length = f.tell() - 8
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+
+        # take the new chunk into the FORM, and only then point the index at it, so a failure at any step leaves a
+        # valid file: at worst the new chunk is an unindexed orphan, which repack drops
+        f.seek(4)
+        f.write(new_length.to_bytes(4, 'big'))
+        f.flush()
+        os.fsync(f.fileno())
+        f.seek(index_position + 12 + entry * 12 + 8)
+        f.write(location.to_bytes(4, 'big'))
+        f.flush()
+        os.fsync(f.fileno())
+        if not shared:
+            f.seek(old_location)
+            f.write(filler_id.encode('ascii'))
+        f.flush()
+    return location
+
+
+def dead_space(filename) -> int:
+    """return how many bytes of a blorb file are taken up by filler chunks"""
+    with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        form_length = int.from_bytes(m[4:8], byteorder='big')
+        return sum(8 + length + length % 2 for ID, position, length in iff.walk_chunks(m, 12, min(len(m), 8 + form_length))
+                   if ID == filler_id)
+
+
+def trace_order(model: blorb.access_model, start=None) -> list[tuple[str, int]]:
+    """turn a recorded access model into a resource order, following the likeliest next resource from start"""
+    seen = set()
+    order = []
+    key = start
+    if key is None and model.following:
+        key = next(iter(model.following))
+    while key is not None and key not in seen:
+        seen.add(key)
+        order.append(key)
+        key = next((k for k in model.predict(key, len(model.following.get(key, ()))) if k not in seen), None)
+        if key is None:  # a dead end; carry on from the most asked for resource not yet placed
+            counts = {}
+            for following in model.following.values():
+                for k, c in following.items():
+                    if k not in seen:
+                        counts[k] = counts.get(k, 0) + c
+            key = max(counts, key=counts.get) if counts else None
+    return order
+
+
+def repack(filename, output=None, order=None, align=0, align_minimum=64 * 1024, drop_orphans=True) -> int:
+    """rewrite a blorb without filler chunks, returning the new size; the file is replaced if no output is given
+
+    RIdx and the other chunks that are read when a blorb is opened go first. If order is given, as a list of
+    (usage, number) pairs or an access_model, the frontispiece and then those resources follow straight after,
+    and the rest keep their places; otherwise every resource keeps its place. If align is given, each resource
+    of at least align_minimum bytes has its data aligned to a multiple of align (mmap.PAGESIZE, say) in the file,
+    with filler chunks making up the gaps. Chunks that look like resources but aren't in the index are dropped
+    unless drop_orphans is False."""
+    with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        form_length, index_position, resources = read_layout(m)
+        chunks = [(ID, position, 8 + length + length % 2)
+                  for ID, position, length in iff.walk_chunks(m, 12, min(len(m), 8 + form_length)) if ID != filler_id]
+        indexed = {r.location for r in resources}
+        front = []
+        body = []
+        for c in chunks:
+            ID, position, size = c
+            if position in indexed:
+                body.append(c)
+            elif ID in blorb.resource_chunk_ids or ID == 'FORM':
+                if not drop_orphans:
+                    body.append(c)
+            elif position == index_position:
+                front.insert(0, c)
+            else:
+                front.append(c)
+
+        if order is not None:
+            start = None
+            for ID, position, size in front:
+                if ID == blorb.frontispiece_chunk.ID:
+                    start = ('Pict', int.from_bytes(m[position + 8:position + 12], byteorder='big'))
+            if isinstance(order, blorb.access_model):
+                order = trace_order(order, start)
+            order = ([start] if start is not None else []) + list(order)
+            locations = {(r.usage, r.number): r.location for r in resources}
+            rank = {}
+            for key in order:
+                if key in locations:
+                    rank.setdefault(locations[key], len(rank))
+            body.sort(key=lambda c: rank.get(c[1], len(rank)))  # sort is stable, so the rest keep their places
+
+        moved = {}
+        layout = []  # (old position or None for filler, new position, size)
+        position = 12
+        for ID, old, size in front + body:
+            if align and old in indexed and size >= align_minimum:
+                gap = -(position if ID == 'FORM' else position + 8) % align
+                if gap:
+                    if gap < 8:  # too small for a filler chunk's header
+                        gap += align
+                    layout.append((None, position, gap))
+                    position += gap
+            moved[old] = position
+            layout.append((old, position, size))
+            position += size
+        index = blorb.resource_index_chunk()
+        index.resources = [blorb.resource(r.usage, r.number, moved[r.location]) for r in resources]
+        index_data = index.get_chunk_data()
+
+        temp = (output or filename) + '.tmp'
+        with open(temp, 'wb') as out:
+            out.write(b'FORM' + (position - 8).to_bytes(4, 'big') + b'IFRS')
+            for old, new, size in layout:
+                if old is None:
+                    out.write(filler_id.encode('ascii') + (size - 8).to_bytes(4, 'big') + bytes(size - 8))
+                elif old == index_position:
+                    out.write(index_data)
+                else:
+                    f.seek(old)
+                    copied = build.copy_file(f, out, size)
+                    if copied < size:  # the last chunk's padding byte may be missing
+                        out.write(bytes(size - copied))
+    os.replace(temp, output or filename)
+    return position
+
+
+def compact(filename, output=None) -> int:
+    """rewrite a blorb without its filler chunks (including any alignment padding), keeping everything else, and
+    return the new size"""
+    return repack(filename, output, drop_orphans=False)
@@ -12,9 +12,8 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU General Public License for more details.
 
-import copy
-
 from . import iff
+from .ifchunks import game_identifier_chunk
 
 
 class z_memory:
@@ -23,24 +22,21 @@ class z_memory:
         self.original_data = bytes(original_data)
 
     def compress(self):
-        changed_data = bytearray(a ^ b for a, b in zip(self.original_data, self.full_data))
-        changed_data = changed_data.rstrip(b'\x00')
+        """XOR the current memory with the original and run-length encode the zeros: a zero byte followed by n
+        stands for n + 1 zero bytes, and trailing zeros are left out"""
+        changed_data = bytes(a ^ b for a, b in zip(self.original_data, self.full_data)).rstrip(b'\x00')
 
         compressed_data = bytearray()
         zerorun = 0
         for a in changed_data:
-            if a == b'\x00':
+            if a == 0:
                 zerorun += 1
                 if zerorun == 256:
-                    zerorun -= 1
-                    compressed_data.append('\x00')
-                    compressed_data.append(zerorun.to_bytes(1, 'big'))
+                    compressed_data.extend((0, 255))
                     zerorun = 0
             else:
                 if zerorun > 0:
-                    zerorun -= 1
-                    compressed_data.append(b'\x00')
-                    compressed_data.append(zerorun.to_bytes(1, 'big'))
+                    compressed_data.extend((0, zerorun - 1))
                     zerorun = 0
                 compressed_data.append(a)
 
@@ -51,11 +47,11 @@ class z_memory:
         zerorun = False
         for a in self.compressed_data:
             if zerorun:
-                runlength = int.from_bytes(a, 'big')
-                uncompressed_data.extend(bytes(runlength))
+                uncompressed_data.extend(bytes(a + 1))
+                zerorun = False
+            elif a == 0:
+                zerorun = True
             else:
-                if a == b'\x00':
-                    zerorun = True
                 uncompressed_data.append(a)
         uncompressed_data.extend(bytes(len(self.original_data) - len(uncompressed_data)))
         self.full_data = bytes(a ^ b for a, b in zip(uncompressed_data, self.original_data))
@@ -141,7 +137,8 @@ class stkschunk(iff.chunk):
                 evalstack.append((self.data[place] << 8) + self.data[place + 1])
                 place += 2
             callstack.append(frame(retPC, False, varnum, numargs, lvars, evalstack))
-        storydata.callstack = copy.deepcopy(callstack)
+        storydata.callstack = [frame(f.retPC, f.discard_result, f.varnum, f.numargs, f.lvars, f.evalstack)
+                               for f in callstack]
         storydata.currentframe = storydata.callstack.pop()
         return callstack
 
@@ -260,9 +257,10 @@ class formchunk(iff.form_chunk):
 ###
 
 class memory_chunk(iff.chunk):
+    __slots__ = ('dynamic_memory',)
+
     def process_data(self):
         """updates the various chunk attributes using the raw_data"""
-        self.ID = self.raw_data[0:4].decode('ascii')
         self.length = int.from_bytes(self.raw_data[4:8], byteorder='big')
         self.dynamic_memory = self.raw_data[8:self.length + 8]
 
@@ -274,19 +272,16 @@ class memory_chunk(iff.chunk):
 
 class cmem_chunk(memory_chunk):
     ID = 'CMem'
+    __slots__ = ()
 
 
 class umem_chunk(memory_chunk):
     ID = 'UMem'
+    __slots__ = ()
 
 
 class frame:
-    retPC = 0
-    discard_result = False
-    varnum = 0
-    numargs = 0
-    lvars = []
-    evalstack = []
+    __slots__ = ('retPC', 'discard_result', 'varnum', 'numargs', 'lvars', 'evalstack')
 
     def __init__(self, retPC, discard_result, varnum, numargs, lvars, evalstack):
         self.retPC = retPC
@@ -299,20 +294,15 @@ class frame:
 
 class stks_chunk(iff.chunk):
     ID = 'Stks'
-    callstack = []
+    __slots__ = ('callstack',)
 
     def process_data(self):
-        self.ID = self.raw_data[0:4].decode('ascii')
         self.length = int.from_bytes(self.raw_data[4:8], byteorder='big')
         self.callstack = []
 
         p = 8
-
-        place = 0
-        while place < len(self.raw_data):
-            lvars = []
-            evalstack = []
-
+        end = min(len(self.raw_data), 8 + self.length)
+        while p + 8 <= end:
             retPC = int.from_bytes(self.raw_data[p:p + 3], byteorder='big')
 
             numvars = self.raw_data[p + 3] & 15
@@ -329,16 +319,14 @@ class stks_chunk(iff.chunk):
                 numargs += 1
                 args = args >> 1
 
-            evalstacksize = int.from_bytes(self.raw_data[p + 6:p + 7], byteorder='big')
+            evalstacksize = int.from_bytes(self.raw_data[p + 6:p + 8], byteorder='big')
 
             p += 8
-            for x in range(numvars):
-                lvars.append(int.from_bytes(self.raw_data[p:p + 1], byteorder='big'))
-                p += 2
-
-            for x in range(evalstacksize):
-                evalstack.append(int.from_bytes(self.raw_data[p:p + 1], byteorder='big'))
-                place += 2
+            lvars = [int.from_bytes(self.raw_data[v:v + 2], byteorder='big') for v in range(p, p + numvars * 2, 2)]
+            p += numvars * 2
+            evalstack = [int.from_bytes(self.raw_data[v:v + 2], byteorder='big')
+                         for v in range(p, p + evalstacksize * 2, 2)]
+            p += evalstacksize * 2
 
             self.callstack.append(frame(retPC, discard_result, varnum, numargs, lvars, evalstack))
 
@@ -371,25 +359,19 @@ class stks_chunk(iff.chunk):
             for e in f.evalstack:
                 data.extend(e.to_bytes(2, 'big'))
 
-        s = len(data) - 8
-        data[4:8] = s.to_bytes(4, 'big')
+        self.length = len(data) - 8
+        data[4:8] = self.length.to_bytes(4, 'big')
         self.raw_data = bytes(data)
 
 
 class intd_chunk(iff.chunk):
     ID = 'IntD'
-    osID = '    '
-    machine_specific = False
-    do_not_copy = False
-    contID = 0
-    terpID = '    '
-    data = 0
+    __slots__ = ('osID', 'machine_specific', 'do_not_copy', 'contID', 'terpID')
 
     def process_data(self):
-        self.ID = self.raw_data[0:4].decode('ascii')
         self.length = int.from_bytes(self.raw_data[4:8], byteorder='big')
-        self.OSid = self.raw_data[8:12].decode('ascii')
-        flags = int.from_bytes(self.raw_data[12], byteorder='big')
+        self.osID = self.raw_data[8:12].decode('ascii') if len(self.raw_data) >= 12 else '    '
+        flags = self.raw_data[12] if len(self.raw_data) > 12 else 0
         if flags & 1:
             self.do_not_copy = True
         else:
@@ -398,9 +380,9 @@ class intd_chunk(iff.chunk):
             self.machine_specific = True
         else:
             self.machine_specific = False
-        self.contID = int.from_bytes(self.raw_data[13], byteorder='big')
-        self.OSid = self.raw_data[16:20].decode('ascii')
-        self.data = self.raw_data[20:]
+        self.contID = self.raw_data[13] if len(self.raw_data) > 13 else 0
+        self.terpID = self.raw_data[16:20].decode('ascii') if len(self.raw_data) >= 20 else '    '
+        self.data = self.raw_data[20:8 + self.length]
 
     def create_data(self):
         data = bytearray()
@@ -417,17 +399,20 @@ class intd_chunk(iff.chunk):
         data.extend(int(0).to_bytes(2, 'big'))
         data.extend(self.terpID.encode())
         data.extend(self.data)
-        data[4:8] = len(data).to_bytes(4, 'big')
+        data[4:8] = (len(data) - 8).to_bytes(4, 'big')
         self.raw_data = bytes(data)
 
 
 class quetzal_chunk(iff.form_chunk):
     subID = 'IFZS'
+    __slots__ = ('ifhd', 'cmem', 'umem', 'stks')
 
-    ifhd = None
-    cmem = None
-    umem = None
-    stks = None
+    def __init__(self, chunk_data=None):
+        self.ifhd = None
+        self.cmem = None
+        self.umem = None
+        self.stks = None
+        super().__init__(chunk_data)
 
 
 class qdata:
@@ -480,3 +465,16 @@ def restore(savedata, qd):
         return False
     else:
         return storydata
+
+
+chunk_types = {'IFhd': game_identifier_chunk,
+               'CMem': cmem_chunk,
+               'UMem': umem_chunk,
+               'Stks': stks_chunk,
+               'IntD': intd_chunk
+               }
+
+form_types = {'IFZS': quetzal_chunk}
+
+registry = iff.chunk_registry(chunk_types, form_types, iff.registry)
+quetzal_chunk.registry = registry
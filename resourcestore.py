@@ -0,0 +1,95 @@
+# Copyright (C) 2001 - 2024 David Fillmore
+#
+# This file is part of ififf.
+#
+# ififf is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# ififf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# a content-addressed store for resource data, so identical pictures and sounds in different blorbs share one buffer
+
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from . import iff
+
+
+def digest(data) -> bytes:
+    return hashlib.blake2b(data, digest_size=20).digest()
+
+
+class resource_store:
+    def __repr__(self):
+        return 'resource store with ' + str(len(self.entries)) + ' entries (' + str(self.live_bytes) + ' bytes live, ' + str(self.idle_bytes) + ' bytes idle)'
+
+    def __init__(self, max_idle_bytes=64 * 1024 * 1024):
+        """max_idle_bytes is how much unreferenced data to keep around in case another blorb asks for it again"""
+        self.max_idle_bytes = max_idle_bytes
+        self.entries: dict[bytes, list] = {}  # digest -> [data, reference count]
+        self.idle: OrderedDict[bytes, None] = OrderedDict()  # unreferenced digests, least recently released first
+        self.live_bytes = 0
+        self.idle_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def intern(self, data) -> tuple[bytes, bytes]:
+        """add a reference to data, returning (digest, shared copy of data)"""
+        key = digest(data)
+        with self.lock:
+            entry = self.entries.get(key)
+            hit = entry is not None
+            if entry is None:
+                self.misses += 1
+                entry = [bytes(data), 0]
+                self.entries[key] = entry
+                self.live_bytes += len(entry[0])
+            else:
+                self.hits += 1
+                if entry[1] == 0:
+                    del self.idle[key]
+                    self.idle_bytes -= len(entry[0])
+                    self.live_bytes += len(entry[0])
+            entry[1] += 1
+        if iff.recording is not None:
+            iff.record_cache('resource store', hit)
+        return key, entry[0]
+
+    def get(self, key) -> bytes | None:
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return None
+        return entry[0]
+
+    def release(self, key):
+        """drop a reference taken by intern; unreferenced data is kept until the idle budget is exceeded"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] == 0:
+                return
+            entry[1] -= 1
+            if entry[1] == 0:
+                self.live_bytes -= len(entry[0])
+                self.idle_bytes += len(entry[0])
+                self.idle[key] = None
+                self._evict(self.max_idle_bytes)
+
+    def clear_idle(self):
+        with self.lock:
+            self._evict(0)
+
+    def _evict(self, budget):
+        while self.idle_bytes > budget:
+            key, _ = self.idle.popitem(last=False)
+            data, _ = self.entries.pop(key)
+            self.idle_bytes -= len(data)
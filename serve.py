@@ -0,0 +1,198 @@
+# Copyright (C) 2001 - 2024 David Fillmore
+#
+# This file is part of ififf.
+#
+# ififf is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# ififf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# a small local HTTP server for blorb resources
+#
+# Resources are addressed as /<blorb file name>/<usage>/<number>, for example /game.zblorb/Snd/3, and are sent
+# straight from the blorb file to the socket with sendfile, so the data never passes through Python.
+# Single byte ranges are supported, so players can seek in long sounds.
+
+from __future__ import annotations
+
+import asyncio
+import mmap
+import os
+import sys
+from urllib.parse import unquote
+
+from . import blorb
+
+usages = {'Exec': 'Exec', 'Pict': 'Pict', 'Snd': 'Snd ', 'Snd ': 'Snd '}
+
+content_types = {'PNG': 'image/png',
+                 'JPEG': 'image/jpeg',
+                 'GIF': 'image/gif',
+                 'FORM': 'audio/aiff',
+                 'OGGV': 'audio/ogg',
+                 'MOD': 'audio/mod',
+                 'MP3': 'audio/mpeg',
+                 'WAV': 'audio/wav',
+                 'MIDI': 'audio/midi'
+                 }
+
+reasons = {200: 'OK', 206: 'Partial Content', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           416: 'Range Not Satisfiable'}
+
+
+def parse_range(header, length) -> tuple[int, int] | None:
+    """return (start, end) for a single 'bytes=' range, end being exclusive, or None if the range can't be satisfied"""
+    units, _, spec = header.partition('=')
+    if units.strip() != 'bytes' or ',' in spec:
+        return None
+    first, _, last = spec.strip().partition('-')
+    try:
+        if first == '':
+            suffix = int(last)
+            if suffix <= 0:
+                return None
+            return max(0, length - suffix), length
+        start = int(first)
+        end = int(last) + 1 if last else length
+    except ValueError:
+        return None
+    end = min(end, length)
+    if start >= end:
+        return None
+    return start, end
+
+
+def load_file(f) -> blorb.blorb:
+    """parse a blorb from an open file, through a read-only mmap of that same descriptor"""
+    return blorb.blorb(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+class resource_server:
+    def __init__(self, directory):
+        self.directory = directory
+        self.blorbs: dict[str, tuple[tuple[int, int, int], blorb.blorb]] = {}  # name -> (file stamp, blorb)
+
+    async def find(self, name, usage, number):
+        """return (file, format, offset, length) for a resource, or None; the caller must close file
+
+        The file is opened once, and the cached index is only used if it was read from the file that descriptor
+        refers to, unchanged (by inode, mtime and size); otherwise it is parsed again from that descriptor, off the
+        event loop. The resource is sent from the same descriptor, so its offsets always belong to that file, even if
+        patch.repack or pack replaces it in the meantime."""
+        if '/' in name or name.startswith('.'):
+            return None
+        try:
+            f = open(os.path.join(self.directory, name), 'rb')
+        except OSError:
+            return None
+        try:
+            st = os.fstat(f.fileno())
+            stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+            cached = self.blorbs.get(name)
+            if cached is not None and cached[0] == stamp:
+                b = cached[1]
+            else:
+                try:
+                    b = await asyncio.get_running_loop().run_in_executor(blorb.get_read_executor(), load_file, f)
+                except (OSError, ValueError, blorb.InvalidBlorbFile):
+                    self.blorbs.pop(name, None)
+                    raise
+                self.blorbs[name] = (stamp, b)
+            offset, length = b.getResourceSpan(usage, number)
+            if usage == 'Exec':
+                format = b.getExecFormat(number)
+            elif usage == 'Pict':
+                format = b.getPictFormat(number)
+            else:
+                format = b.getSndFormat(number)
+        except (OSError, ValueError, KeyError, blorb.InvalidBlorbFile):
+            f.close()
+            return None
+        except BaseException:
+            f.close()
+            raise
+        return f, format, offset, length
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while await self.handle_request(reader, writer):
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, reader, writer) -> bool:
+        request = await reader.readline()
+        if not request:
+            return False
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = headers.get('connection', '').lower() != 'close'
+
+        try:
+            method, path, _ = request.decode('latin-1').split()
+        except ValueError:
+            await self.respond(writer, 400)
+            return False
+        if method not in ('GET', 'HEAD'):
+            await self.respond(writer, 405)
+            return keep_alive
+
+        parts = unquote(path).strip('/').split('/')
+        found = None
+        if len(parts) == 3 and parts[1] in usages and parts[2].isdigit():
+            found = await self.find(parts[0], usages[parts[1]], int(parts[2]))
+        if found is None:
+            await self.respond(writer, 404)
+            return keep_alive
+        f, format, offset, length = found
+        with f:
+            start, end = 0, length
+            status = 200
+            extra = {'Accept-Ranges': 'bytes',
+                     'Content-Type': content_types.get(format, 'application/octet-stream')}
+            if 'range' in headers:
+                r = parse_range(headers['range'], length)
+                if r is None:
+                    extra['Content-Range'] = 'bytes */' + str(length)
+                    await self.respond(writer, 416, extra)
+                    return keep_alive
+                start, end = r
+                status = 206
+                extra['Content-Range'] = 'bytes ' + str(start) + '-' + str(end - 1) + '/' + str(length)
+
+            await self.respond(writer, status, extra, end - start)
+            if method == 'GET' and end > start:
+                # uses os.sendfile when the transport allows it, and falls back to reading the file otherwise
+                await asyncio.get_running_loop().sendfile(writer.transport, f, offset + start, end - start)
+        return keep_alive
+
+    async def respond(self, writer, status, headers=None, length=0):
+        lines = ['HTTP/1.1 ' + str(status) + ' ' + reasons[status], 'Content-Length: ' + str(length)]
+        for name, value in (headers or {}).items():
+            lines.append(name + ': ' + value)
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        await writer.drain()
+
+
+async def serve(directory, host='127.0.0.1', port=8080):
+    server = resource_server(directory)
+    s = await asyncio.start_server(server.handle, host, port)
+    async with s:
+        await s.serve_forever()
+
+
+if __name__ == '__main__':
+    asyncio.run(serve(sys.argv[1] if len(sys.argv) > 1 else '.',
+                      port=int(sys.argv[2]) if len(sys.argv) > 2 else 8080))
@@ -0,0 +1,119 @@
+# Copyright (C) 2001 - 2024 David Fillmore
+#
+# This file is part of ififf.
+#
+# ififf is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# ififf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# blorbs loaded once into shared memory and attached by name from other processes
+#
+# The segment holds a 16 byte header ('IFSB' and the length of the blorb) followed by the blorb file itself.
+# Every process that attaches gets a read-only blorb_view whose resources are memoryviews into the segment, so
+# however many workers serve a game, its resources are only in memory once.
+
+from __future__ import annotations
+
+import os
+import threading
+from multiprocessing import shared_memory
+
+from . import blorb
+
+magic = b'IFSB'
+header_size = 16
+register_lock = threading.Lock()  # held while resource_tracker.register is switched off for an attach
+
+
+def open_segment(name):
+    """attach to an existing segment without registering it with the resource tracker, which only the owner does
+
+    Before 3.13 SharedMemory always registers, and unregistering afterwards would also drop the owner's
+    registration, since child processes share the owner's tracker; so registering is skipped for this one call."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        from multiprocessing import resource_tracker
+        with register_lock:
+            register = resource_tracker.register
+            resource_tracker.register = lambda name, rtype: None if rtype == 'shared_memory' else register(name, rtype)
+            try:
+                return shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+
+
+class shared_blorb:
+    """a read-only blorb in shared memory; any blorb_view attribute or method can be used on it directly"""
+
+    def __repr__(self):
+        return 'shared blorb ' + self.name
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner=False):
+        self.shm = shm
+        self.owner = owner
+        if bytes(shm.buf[0:4]) != magic:
+            shm.close()
+            raise blorb.InvalidBlorbFile('not a shared blorb segment')
+        if bytes(shm.buf[header_size:header_size + 4]) != b'FORM' or \
+                bytes(shm.buf[header_size + 8:header_size + 12]) != b'IFRS':
+            shm.close()
+            raise blorb.InvalidBlorbFile('not a blorb file')
+        length = int.from_bytes(shm.buf[4:12], byteorder='big')
+        self.data = shm.buf[header_size:header_size + length]
+        try:
+            self.blorb = blorb.blorb(self.data).freeze()
+        except BaseException:
+            self.data.release()
+            raise
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__['blorb'], name)
+
+    def close(self):
+        """detach from the segment; any resource data still referenced elsewhere stops being usable"""
+        for table in (self.blorb.games, self.blorb.images, self.blorb.sounds):
+            for r in table.values():
+                if isinstance(r.data, memoryview):
+                    r.data.release()
+        self.data.release()
+        self.shm.close()
+
+    def unlink(self):
+        """remove the segment once every process has closed it; only the process that shared the blorb should call this"""
+        self.shm.unlink()
+
+
+def share(filename, name=None) -> shared_blorb:
+    """copy a blorb file into a new shared memory segment, returning it attached; other processes use attach(result.name)"""
+    with open(filename, 'rb') as f:
+        length = os.fstat(f.fileno()).st_size
+        with register_lock:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=header_size + length)
+        try:
+            shm.buf[0:4] = magic
+            shm.buf[4:12] = length.to_bytes(8, 'big')
+            with shm.buf[header_size:header_size + length] as view:
+                f.readinto(view)
+            return shared_blorb(shm, owner=True)
+        except BaseException:
+            shm.unlink()
+            try:
+                shm.close()
+            except BufferError:  # views of it held by the traceback; it is unmapped when they go
+                pass
+            raise
+
+
+def attach(name) -> shared_blorb:
+    return shared_blorb(open_segment(name))
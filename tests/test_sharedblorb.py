@@ -0,0 +1,71 @@
+# Copyright (C) 2001 - 2024 David Fillmore
+#
+# This file is part of ififf.
+#
+# ififf is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# ififf is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from .. import sharedblorb
+from ..benchmarks import corpus
+
+package = __package__.rsplit('.', 1)[0]
+
+# run in a fresh interpreter, so that its resource tracker's complaints can be read from stderr
+owner_script = '''
+import multiprocessing, os, sys
+from {package} import sharedblorb
+from {package}.tests import test_sharedblorb
+
+shared = sharedblorb.share(sys.argv[1])
+child = multiprocessing.get_context('spawn').Process(target=test_sharedblorb.attach_and_close, args=(shared.name,))
+child.start()
+child.join()
+shared.close()
+shared.unlink()
+print(child.exitcode, os.path.exists('/dev/shm/' + shared.name.lstrip('/')))
+'''
+
+
+def attach_and_close(name):
+    b = sharedblorb.attach(name)
+    if not b.resources:
+        sys.exit(1)
+    b.close()
+
+
+class test_attach(unittest.TestCase):
+    def setUp(self):
+        f = tempfile.NamedTemporaryFile(suffix='.blb', delete=False)
+        with f:
+            f.write(corpus.make_blorb(pictures=4, sounds=1))
+        self.filename = f.name
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_attach_in_child_leaves_owner_registered(self):
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        env = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get('PYTHONPATH', ''))
+        result = subprocess.run([sys.executable, '-c', owner_script.format(package=package), self.filename], env=env,
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.split(), ['0', 'False'])
+        self.assertNotIn('KeyError', result.stderr)
+        self.assertNotIn('leaked', result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()